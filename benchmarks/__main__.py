@@ -0,0 +1,119 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""iCLIPS benchmark suite.
+
+Run the benchmarks saving the results as baseline:
+
+    $ python -m benchmarks run --output baseline.json
+
+Compare new results against the baseline:
+
+    $ python -m benchmarks run --output current.json
+    $ python -m benchmarks compare baseline.json current.json
+
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+
+import clips
+
+from iclips import __version__
+from benchmarks.handlers import benchmarks, measure
+
+
+SCALES = {'small': (100, 1000),
+          'full': (100, 1000, 10000)}
+
+
+def run(arguments: argparse.Namespace) -> int:
+    results = {}
+
+    for benchmark in benchmarks(SCALES[arguments.scale]):
+        if arguments.filter and arguments.filter not in benchmark.name:
+            continue
+
+        name = '%s[%d]' % (benchmark.name, benchmark.amount)
+        result = results[name] = measure(benchmark, arguments.repeat)
+        print("%-28s %12.6f s %14.1f %s/s" % (
+            name, result['latency'], result['throughput'], result['unit']))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump({'iclips': __version__,
+                       'python': platform.python_version(),
+                       'clipspy': getattr(clips, '__version__', ''),
+                       'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'results': results}, output, indent=2)
+
+    return 0
+
+
+def compare(arguments: argparse.Namespace) -> int:
+    """Compare the latencies flagging the ones beyond threshold."""
+    with open(arguments.baseline) as baseline:
+        baseline = json.load(baseline)['results']
+    with open(arguments.current) as current:
+        current = json.load(current)['results']
+
+    regressions = 0
+
+    for name in sorted(set(baseline) & set(current)):
+        ratio = current[name]['latency'] / baseline[name]['latency']
+        regression = ratio > 1 + arguments.threshold
+        regressions += regression
+
+        print("%-28s %12.6f s %12.6f s %+8.1f%% %s" % (
+            name, baseline[name]['latency'], current[name]['latency'],
+            (ratio - 1) * 100, 'SLOWER' if regression else ''))
+
+    print("\n%d regressions beyond %d%%" % (
+        regressions, arguments.threshold * 100))
+
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="iCLIPS benchmark suite")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('-o', '--output', help="JSON results file")
+    run_parser.add_argument('-s', '--scale', choices=SCALES, default='full')
+    run_parser.add_argument('-r', '--repeat', type=int, default=3)
+    run_parser.add_argument('-f', '--filter',
+                            help="run the benchmarks matching the name")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = commands.add_parser(
+        'compare', help="compare results against a baseline")
+    compare_parser.add_argument('baseline', help="baseline JSON results")
+    compare_parser.add_argument('current', help="current JSON results")
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                                help="slowdown ratio flagged (default 0.1)")
+    compare_parser.set_defaults(function=compare)
+
+    arguments = parser.parse_args()
+
+    return arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
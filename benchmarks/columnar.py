@@ -0,0 +1,164 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar export and import against the text round-trip.
+
+The text round-trip saves the facts via (save-facts), parses the file
+into a DataFrame and, the other way, writes the DataFrame rows as facts
+loaded via (load-facts). The text round-trip is not exact: CLIPS saves
+floats with 15 significant digits. Before measuring, the DataFrame and
+Arrow round-trips are checked to restore the very same facts.
+
+    $ python -m benchmarks.columnar [facts ...]
+
+"""
+
+import os
+import re
+import sys
+import time
+import tempfile
+
+import clips
+import pandas
+
+from iclips.columnar import to_dataframe, from_dataframe
+from iclips.columnar import to_arrow, from_arrow
+
+
+TEMPLATE = """
+(deftemplate person
+  (slot name (type STRING))
+  (slot city (type SYMBOL))
+  (slot age (type INTEGER))
+  (slot score (type FLOAT))
+  (multislot tags (type SYMBOL)))
+"""
+SLOT_REGEX = re.compile(r'\(([^\s()]+)((?:\s+[^()]*)?)\)')
+VALUE_REGEX = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s"]+')
+
+
+def environment(facts: int) -> clips.Environment:
+    env = clips.Environment()
+    env.build(TEMPLATE)
+    template = env.find_template('person')
+
+    for index in range(facts):
+        template.assert_fact(name='person %d' % index,
+                             city=clips.Symbol('city%d' % (index % 100)),
+                             age=index % 90,
+                             score=index / 7,
+                             tags=[clips.Symbol('a'), clips.Symbol('b')])
+
+    return env
+
+
+def text_export(env: clips.Environment, path: str) -> pandas.DataFrame:
+    env.eval('(save-facts "%s" local person)' % path)
+
+    with open(path) as facts_file:
+        rows = [dict(parse_slots(line)) for line in facts_file
+                if line.startswith('(person')]
+
+    return pandas.DataFrame(rows)
+
+
+def parse_slots(line: str) -> iter:
+    for name, values in SLOT_REGEX.findall(line[len('(person'):-1]):
+        values = [parse_value(v) for v in VALUE_REGEX.findall(values)]
+        yield name, values if name == 'tags' else values[0]
+
+
+def parse_value(value: str):
+    if value.startswith('"'):
+        return value[1:-1].replace('\\"', '"')
+
+    for number in (int, float):
+        try:
+            return number(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+def text_import(env: clips.Environment, frame: pandas.DataFrame, path: str):
+    with open(path, 'w') as facts_file:
+        for row in frame.itertuples(index=False):
+            facts_file.write(
+                '(person (name "%s") (city %s) (age %d) (score %r) '
+                '(tags %s))\n' % (row.name.replace('"', '\\"'), row.city,
+                                  row.age, row.score, ' '.join(row.tags)))
+
+    env.eval('(load-facts "%s")' % path)
+
+
+def facts(env: clips.Environment) -> list:
+    return sorted(str(f) for f in env.find_template('person').facts())
+
+
+def check(env: clips.Environment):
+    expected = facts(env)
+
+    for export, load in ((to_dataframe, from_dataframe),
+                         (to_arrow, from_arrow)):
+        data = export(env, 'person')
+        env.reset()
+        load(env, 'person', data)
+        if facts(env) != expected:
+            raise AssertionError("%s round-trip changed the facts"
+                                 % export.__name__)
+
+
+def measure(function: callable, *arguments) -> tuple:
+    start = time.perf_counter()
+    result = function(*arguments)
+
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [1000, 10000, 100000]
+
+    check(environment(1000))
+
+    print("%10s %10s %10s %10s %10s %10s %10s" % (
+        'facts', 'text out', 'pandas out', 'arrow out',
+        'text in', 'pandas in', 'arrow in'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'facts.clp')
+
+        for size in sizes:
+            env = environment(size)
+            text_out, frame = measure(text_export, env, path)
+            pandas_out, frame = measure(to_dataframe, env, 'person')
+            arrow_out, table = measure(to_arrow, env, 'person')
+
+            timings = []
+            for function, data in ((text_import, frame),
+                                   (from_dataframe, frame),
+                                   (from_arrow, table)):
+                env.reset()
+                arguments = (env, data, path) if function is text_import \
+                    else (env, 'person', data)
+                timings.append(measure(function, *arguments)[0])
+
+            print("%10d %10.4f %10.4f %10.4f %10.4f %10.4f %10.4f" % (
+                (size, text_out, pandas_out, arrow_out) + tuple(timings)))
+
+
+if __name__ == '__main__':
+    main()
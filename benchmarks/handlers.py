@@ -0,0 +1,172 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the kernel request handlers.
+
+The handlers are driven in-process, messages are serialized
+by a real Session and discarded by a stub IOPub socket.
+
+"""
+
+import time
+from typing import NamedTuple
+
+from jupyter_client.session import Session
+
+from iclips.clips_kernel import CLIPSKernel
+from iclips.clips_pygments import CLIPSLexer
+
+
+class StubSocket:
+    """IOPub socket discarding the messages it is sent."""
+    def __init__(self):
+        self.messages = 0
+        self.size = 0
+
+    def send_multipart(self, parts: list, *_args, **_kwargs):
+        self.messages += 1
+        self.size += sum(len(p) for p in parts)
+
+
+class Benchmark(NamedTuple):
+    """A benchmark measuring an operation on a given amount of units.
+
+    The setup function returns the arguments of the operation.
+
+    """
+    name: str
+    unit: str
+    amount: int
+    setup: callable
+    operation: callable
+
+
+def new_kernel(code: str = '') -> CLIPSKernel:
+    kernel = CLIPSKernel(session=Session(), iopub_socket=StubSocket())
+    if code:
+        kernel.do_execute(code, False)
+
+    return kernel
+
+
+def measure(benchmark: Benchmark, repeat: int = 3) -> dict:
+    """Run the benchmark returning its best latency and throughput."""
+    timings = []
+
+    for _ in range(repeat):
+        arguments = benchmark.setup(benchmark.amount)
+        start = time.perf_counter()
+        benchmark.operation(*arguments)
+        timings.append(time.perf_counter() - start)
+
+    latency = min(timings)
+
+    return {'unit': benchmark.unit,
+            'amount': benchmark.amount,
+            'latency': latency,
+            'throughput': benchmark.amount / latency if latency else 0}
+
+
+def rules(amount: int) -> str:
+    return ''.join('(deftemplate t%d (slot s%d))\n'
+                   '(defrule r%d (t%d (s%d ?v)) => (assert (done ?v)))\n'
+                   % ((i,) * 5) for i in range(amount))
+
+
+def facts(amount: int) -> str:
+    return ''.join('  (person (name "p%d") (age %d)) ; fact %d\n'
+                   % (i, i % 100, i) for i in range(amount))
+
+
+def cell_size(amount: int) -> tuple:
+    code = ('(deftemplate person (slot name) (slot age))\n'
+            '(deffacts people\n%s)' % facts(amount))
+
+    return new_kernel(), code
+
+
+def construct_count(amount: int) -> tuple:
+    return new_kernel(), rules(amount)
+
+
+def fact_count(amount: int) -> tuple:
+    kernel = new_kernel(
+        '(deftemplate person (slot name) (slot age))\n'
+        '(defrule adult (person (age ?a&:(>= ?a 18))) => (assert (adult ?a)))'
+        '\n(deffacts people\n%s)\n(reset)' % facts(amount))
+
+    return kernel, '(run)'
+
+
+def output_volume(amount: int) -> tuple:
+    return new_kernel(), ('(loop-for-count (?i 1 %d) '
+                          '(printout t "line " ?i crlf))' % amount)
+
+
+def execute(kernel: CLIPSKernel, code: str):
+    kernel.do_execute(code, False)
+
+
+def complete_setup(amount: int) -> tuple:
+    return new_kernel(rules(amount)), '(assert (t1', 11
+
+
+def complete(kernel: CLIPSKernel, code: str, cursor: int):
+    kernel.do_complete(code, cursor)
+    kernel.completion_index.invalidate()
+    kernel.do_complete(code, cursor)
+
+
+def is_complete_setup(amount: int) -> tuple:
+    return new_kernel(), ('(deffacts people\n%s' % facts(amount)).splitlines()
+
+
+def is_complete(kernel: CLIPSKernel, lines: list):
+    """Simulate a console sending the buffer on each new line."""
+    code = ''
+
+    for line in lines:
+        code += line + '\n'
+        kernel.do_is_complete(code)
+
+
+def lexer_setup(amount: int) -> tuple:
+    return CLIPSLexer(), rules(amount) + facts(amount)
+
+
+def lex(lexer, code: str):
+    for _ in lexer.get_tokens(code):
+        pass
+
+
+def benchmarks(scales: tuple) -> list:
+    """Return the benchmarks at the given scales."""
+    return [benchmark
+            for amount in scales
+            for benchmark in (
+                Benchmark('execute-cell-size', 'facts', amount,
+                          cell_size, execute),
+                Benchmark('execute-constructs', 'rules', amount,
+                          construct_count, execute),
+                Benchmark('execute-run', 'facts', amount,
+                          fact_count, execute),
+                Benchmark('execute-output', 'lines', amount,
+                          output_volume, execute),
+                Benchmark('complete', 'rules', amount,
+                          complete_setup, complete),
+                Benchmark('is-complete', 'lines', amount,
+                          is_complete_setup, is_complete),
+                Benchmark('lexer', 'rules', amount,
+                          lexer_setup, lex))]
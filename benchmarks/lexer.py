@@ -0,0 +1,106 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Highlighting time against rulebase size.
+
+Compares the CLIPSLexer with the regular expression lexer defining
+its tokens. Before measuring, the token streams of both lexers
+are checked to be identical over the generated rulebase and over
+random text built from CLIPS fragments.
+
+    $ python -m benchmarks.lexer [rules...]
+
+"""
+
+import sys
+import time
+import random
+
+from iclips.common import KEYWORDS, BUILTINS
+from iclips.clips_pygments import CLIPSLexer, RegexCLIPSLexer
+
+
+RULE = '''(defrule rule-%(n)d "Rule %(n)d \\"quoted\\" \\\\ escaped"
+  (declare (salience -%(n)d))
+  ?f <- (person (name ?name&:(neq ?name nil)) (age ?age&:(> ?age %(n)d)))
+  (test (and (>= (length$ (create$ a b c)) 3) (eq (sym-cat a %(n)d) a%(n)d)))
+  (object (is-a PERSON) (name [person-%(n)d]) (tags $?tags))
+  =>
+  (modify ?f (age (+ ?age 1.5)) (tags (expand$ (create$ TRUE FALSE))))
+  (printout t "Modified " ?name crlf))  ; rule %(n)d
+'''
+FACTS = '''(deftemplate person-%(n)d
+  (slot name (type STRING SYMBOL))
+  (slot age (type INTEGER FLOAT) (default -%(n)d))
+  (multislot tags (default SYMBOLIC nilly orange testing)))
+(deffacts people-%(n)d (person-%(n)d (name "John %(n)d") (age %(n)d.5)))
+'''
+FRAGMENTS = (KEYWORDS + BUILTINS +
+             ('(', ')', '[', ']', ' ', '\n', '\t', '?', '$?', '"', '\\"',
+              ';', '&', '|', '~', ':', '=', '<-', '=>', "'", '#', '`', ',@',
+              ',', '.', '-', '1', '2.5', '-3', 'TRUE', 'FALSE', 'nil',
+              'x', '{', '}', 'é'))
+
+
+def rulebase(rules: int) -> str:
+    return ''.join((RULE + FACTS) % {'n': n} for n in range(rules))
+
+
+def fuzz(fragments: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+
+    return ''.join(generator.choice(FRAGMENTS) for _ in range(fragments))
+
+
+def check(code: str):
+    expected = list(RegexCLIPSLexer().get_tokens(code))
+    tokens = list(CLIPSLexer().get_tokens(code))
+
+    for index, (token, expect) in enumerate(zip(tokens, expected)):
+        if token != expect:
+            raise AssertionError("Token %d: %r instead of %r"
+                                 % (index, token, expect))
+    if len(tokens) != len(expected):
+        raise AssertionError("%d tokens instead of %d"
+                             % (len(tokens), len(expected)))
+
+
+def measure(lexer, code: str) -> float:
+    start = time.perf_counter()
+    for _ in lexer.get_tokens(code):
+        pass
+
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [10, 100, 1000, 10000]
+
+    check(rulebase(100))
+    for seed in range(10):
+        check(fuzz(20000, seed))
+
+    print("%10s %12s %14s %14s" % ('rules', 'bytes', 'regex (s)', 'lexer (s)'))
+    for size in sizes:
+        code = rulebase(size)
+        check(code)
+
+        print("%10d %12d %14.6f %14.6f" % (
+            size, len(code),
+            measure(RegexCLIPSLexer(), code), measure(CLIPSLexer(), code)))
+
+
+if __name__ == '__main__':
+    main()
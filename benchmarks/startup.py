@@ -0,0 +1,115 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Kernel cold start time.
+
+Measures, in fresh interpreters, the import time of the kernel module
+against the one of ipykernel alone, and the time taken by a launched
+kernel to reply to the first kernel_info and execute requests.
+
+    $ python -m benchmarks.startup [repeat]
+
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+from jupyter_client.manager import KernelManager
+
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+"""
+KERNEL_NAME = 'iclips-benchmark'
+
+
+def import_time(module: str) -> float:
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT % module])
+
+    return float(output)
+
+
+def kernel_spec(directory: str):
+    """Install a kernel spec running the kernel from this interpreter."""
+    path = os.path.join(directory, 'kernels', KERNEL_NAME)
+    os.makedirs(path)
+
+    with open(os.path.join(path, 'kernel.json'), 'w') as spec:
+        json.dump({'display_name': KERNEL_NAME,
+                   'language': 'clips',
+                   'argv': [sys.executable, '-m', 'iclips.clips_kernel',
+                            '-f', '{connection_file}']}, spec)
+
+
+def first_replies() -> tuple:
+    """Return the seconds from launch to the first kernel_info
+    and execute replies.
+
+    """
+    manager = KernelManager(kernel_name=KERNEL_NAME)
+
+    start = time.perf_counter()
+    manager.start_kernel()
+    client = manager.client()
+    client.start_channels()
+
+    try:
+        client.kernel_info(reply=True, timeout=60)
+        kernel_info = time.perf_counter() - start
+        client.execute_interactive('(+ 1 2)', timeout=60,
+                                   output_hook=lambda _: None)
+        execute = time.perf_counter() - start
+    finally:
+        client.stop_channels()
+        manager.shutdown_kernel(now=True)
+
+    return kernel_info, execute
+
+
+def summary(name: str, timings: list):
+    print("%-24s %10.4f %10.4f %10.4f" % (
+        name, min(timings), statistics.median(timings), max(timings)))
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        kernel_spec(directory)
+        os.environ['JUPYTER_PATH'] = directory
+
+        ipykernel = [import_time('ipykernel.kernelbase')
+                     for _ in range(repeat)]
+        kernel = [import_time('iclips.clips_kernel') for _ in range(repeat)]
+        replies = [first_replies() for _ in range(repeat)]
+
+    print("%-24s %10s %10s %10s" % ('seconds', 'min', 'median', 'max'))
+    summary('import ipykernel', ipykernel)
+    summary('import iclips kernel', kernel)
+    summary('first kernel_info reply', [r[0] for r in replies])
+    summary('first execute reply', [r[1] for r in replies])
+
+
+if __name__ == '__main__':
+    main()
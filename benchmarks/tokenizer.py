@@ -0,0 +1,74 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Cell parsing time against cell size.
+
+Compares the tokenizer with the recursive regular expression
+previously used to split cells into top level forms,
+which requires the regex package.
+
+    $ python -m benchmarks.tokenizer
+
+"""
+
+import sys
+import timeit
+
+import regex
+
+from iclips.tokenizer import split_forms
+
+
+PARENTHESES_REGEX = r'([^()]*\((?:[^()]++|(?R))*+\))'
+REGEX_MAX_SIZE = 1000  # the regex takes minutes above this size
+FACT = '  (person (name "John ; Doe") (age %d) (tags a b c)) ; person %d\n'
+
+
+def deffacts(facts: int) -> str:
+    return ''.join(['(deffacts people\n'] +
+                   [FACT % (i, i) for i in range(facts)] +
+                   [')\n'])
+
+
+def regex_split(code: str) -> list:
+    return regex.findall(PARENTHESES_REGEX, regex.sub(r';.*', '', code))
+
+
+def measure(function: callable, code: str) -> float:
+    timer = timeit.Timer(lambda: function(code))
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(3, number)) / number
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [10, 100, 1000, 10000, 100000]
+
+    print("%10s %12s %14s %14s" % (
+        'facts', 'bytes', 'regex (s)', 'tokenizer (s)'))
+    for size in sizes:
+        code = deffacts(size)
+
+        if size <= REGEX_MAX_SIZE:
+            regex_time = '%14.6f' % measure(regex_split, code)
+        else:
+            regex_time = '%14s' % '-'
+
+        print("%10d %12d %s %14.6f" % (
+            size, len(code), regex_time, measure(split_forms, code)))
+
+
+if __name__ == '__main__':
+    main()
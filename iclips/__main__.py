@@ -16,10 +16,36 @@
 # along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
 
 
+import sys
+import argparse
 import subprocess
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        prog='iclips', description="CLIPS Jupyter console")
+    commands = parser.add_subparsers(dest='command')
+
+    commands.add_parser('console', help="run the console (default)")
+
+    run_parser = commands.add_parser(
+        'run', help="execute CLIPS files or notebooks without a frontend")
+    run_parser.add_argument('files', nargs='+', metavar='FILE',
+                            help="CLIPS (.clp) file or notebook (.ipynb)")
+    run_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help="files executed in parallel (default 1)")
+    run_parser.add_argument('-i', '--stdin', metavar='FILE',
+                            help="file read by CLIPS as standard input")
+    run_parser.add_argument('-q', '--quiet', action='store_true',
+                            help="do not print the timing summary")
+
+    arguments = parser.parse_args()
+
+    if arguments.command == 'run':
+        from iclips.runner import main as run
+
+        sys.exit(run(arguments))
+
     subprocess.call("jupyter console --kernel clips", shell=True)
 
 
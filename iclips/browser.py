@@ -0,0 +1,214 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Paginated browsing of facts and instances.
+
+Only the facts or instances within the requested page are rendered.
+If sorted, the working memory is scanned keeping only the elements
+preceding the end of the page.
+
+"""
+
+import heapq
+from itertools import islice
+
+from iclips.display import table
+
+
+class MemoryPage:
+    """A page of the facts or instances within the environment.
+
+    The elements can be filtered by template or class name
+    and sorted by index, name, template or class, or slot value.
+    A sort key starting with `-` sorts in descending order.
+
+    """
+    def __init__(self, kind: str, name: str = None, sort: str = None,
+                 page: int = 1, size: int = 50):
+        if kind not in ('facts', 'instances'):
+            raise ValueError("Unknown working memory element %s" % kind)
+        if page < 1 or size < 1:
+            raise ValueError("Page and size must be positive")
+
+        self.kind = kind
+        self.name = name
+        self.sort = sort
+        self.page = page
+        self.size = size
+
+    def elements(self, environment):
+        """Iterate over the elements matching the filter."""
+        if self.kind == 'facts':
+            if self.name is None:
+                return environment.facts()
+            return environment.find_template(self.name).facts()
+
+        if self.name is None:
+            return environment.instances()
+        return environment.find_class(self.name).instances()
+
+    def fetch(self, environment) -> tuple:
+        """Return the total amount of elements and the ones in the page."""
+        start = (self.page - 1) * self.size
+        stop = start + self.size
+
+        if self.sort is None:
+            rows = list(islice(self.elements(environment), start, stop))
+
+            return self.count(environment), rows
+
+        counter = [0]
+        descending = self.sort.startswith('-')
+        key = sort_key(self.kind, self.sort.lstrip('-'))
+        select = heapq.nlargest if descending else heapq.nsmallest
+
+        def counted(elements):
+            for element in elements:
+                counter[0] += 1
+                yield element
+
+        rows = select(stop, counted(self.elements(environment)), key=key)
+
+        return counter[0], rows[start:]
+
+    def count(self, environment) -> int:
+        """Return the amount of elements matching the filter.
+
+        Facts are counted within CLIPS.
+
+        """
+        if self.kind == 'instances':
+            return sum(1 for _ in self.elements(environment))
+        if self.name is None:
+            return environment.eval('(length$ (get-fact-list *))')
+
+        template = environment.find_template(self.name)
+
+        return environment.eval('(length$ (find-all-facts ((?f %s)) TRUE))'
+                                % template.name)
+
+    def display(self, environment) -> dict:
+        """Render the page as plain text, HTML and JSON.
+
+        Pages beyond the last one show the last one.
+
+        """
+        total, elements = self.fetch(environment)
+        pages = max(1, -(-total // self.size))
+        if self.page > pages:
+            self.page = pages
+            total, elements = self.fetch(environment)
+        title = "%s %s page %d of %d (%d %s)" % (
+            self.kind.capitalize(), self.name or '', self.page, pages,
+            total, self.kind)
+        headers, rows, records = self.render(elements)
+
+        data = table(headers, rows, title=' '.join(title.split()))
+        data['application/json'] = {'kind': self.kind,
+                                    'name': self.name,
+                                    'sort': self.sort,
+                                    'page': self.page,
+                                    'pages': pages,
+                                    'size': self.size,
+                                    'total': total,
+                                    'rows': records}
+
+        return data
+
+    def render(self, elements: list) -> tuple:
+        """Return the table headers, rows and the JSON records."""
+        if self.kind == 'facts':
+            identifiers = [('f-%d' % e.index, e.template.name, e.index)
+                           for e in elements]
+            headers = ('Fact', 'Template')
+        else:
+            identifiers = [('[%s]' % e.name, e.instance_class.name, e.name)
+                           for e in elements]
+            headers = ('Instance', 'Class')
+        slots = [element_slots(e) for e in elements]
+        records = [{'id': i[2], headers[1].lower(): i[1],
+                    'slots': {n: json_value(v) for n, v in s}}
+                   for i, s in zip(identifiers, slots)]
+
+        if self.name is not None:  # homogeneous elements, a column per slot
+            names = tuple(n for n, _ in slots[0]) if slots else ()
+            rows = [(i[0], i[1]) + tuple(text_value(v) for _, v in s)
+                    for i, s in zip(identifiers, slots)]
+
+            return headers + names, rows, records
+
+        rows = [(i[0], i[1], ' '.join('(%s %s)' % (n, text_value(v))
+                                      for n, v in s))
+                for i, s in zip(identifiers, slots)]
+
+        return headers + ('Slots',), rows, records
+
+
+def sort_key(kind: str, name: str) -> callable:
+    """Return the key function sorting the elements by the given name.
+
+    Numbers precede strings and symbols, which precede multifields
+    and other values. Elements missing the slot are greater than any other.
+
+    """
+    if name == 'index' and kind == 'facts':
+        return lambda e: e.index
+    if name == 'name' and kind == 'instances':
+        return lambda e: str(e.name)
+    if name in ('template', 'class'):
+        return (lambda e: e.template.name) if kind == 'facts' \
+            else (lambda e: e.instance_class.name)
+
+    def slot_key(element):
+        try:
+            value = element[name]
+        except (LookupError, TypeError):
+            return 4, ''
+
+        if isinstance(value, (int, float)):
+            return 0, value
+        if isinstance(value, str):
+            return 1, value
+        if isinstance(value, tuple):
+            return 2, text_value(value)
+
+        return 3, str(value)
+
+    return slot_key
+
+
+def element_slots(element) -> list:
+    """Return the slot names and values of a fact or instance."""
+    if hasattr(element, 'template') and element.template.implied:
+        return [('values', tuple(element))]
+
+    return list(element)
+
+
+def text_value(value) -> str:
+    if isinstance(value, tuple):
+        return ' '.join(text_value(v) for v in value)
+
+    return str(value)
+
+
+def json_value(value):
+    if isinstance(value, tuple):
+        return [json_value(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+
+    return str(value)
+
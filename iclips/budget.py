@@ -0,0 +1,174 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Resource budgets for the execution of CLIPS code."""
+
+import time
+import threading
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when the execution exceeds one of its budgets."""
+
+
+class Budget:
+    """Wall clock time, rule firings and CLIPS memory limits.
+
+    A limit set to 0 is disabled, negative limits are rejected.
+
+    """
+    def __init__(self, seconds: float = 0, firings: int = 0, memory: int = 0):
+        self.limits = {'time': seconds, 'firings': firings, 'memory': memory}
+        check_limits(self.limits)
+        self.usage = {'time': 0.0, 'firings': 0, 'memory': 0}
+        self._start = time.monotonic()
+
+    def __str__(self):
+        limits = ', '.join('%s %s' % (name, UNITS[name](limit))
+                           for name, limit in self.limits.items() if limit)
+
+        return "Budget: %s" % (limits or 'unlimited')
+
+    @property
+    def active(self) -> bool:
+        return any(self.limits.values())
+
+    @property
+    def remaining_firings(self) -> int:
+        """Rule firings left within the budget, None if unlimited."""
+        limit = self.limits['firings']
+
+        return max(limit - self.usage['firings'], 0) if limit else None
+
+    def copy(self, **limits) -> 'Budget':
+        """Return a new Budget overriding the given limits."""
+        check_limits(limits)
+        budget = Budget()
+        budget.limits.update(self.limits)
+        budget.limits.update(limits)
+
+        return budget
+
+    def overrun(self, memory: int = None) -> bool:
+        """Whether the time or the given memory in use exceed the budget.
+
+        Only the memory peak is accounted: safe to call from other
+        threads while the budget is checked.
+
+        """
+        seconds, limit = self.limits['time'], self.limits['memory']
+        if memory is not None:
+            self.usage['memory'] = max(self.usage['memory'], memory)
+
+        return bool(
+            (seconds and time.monotonic() - self._start > seconds) or
+            (limit and memory is not None and memory > limit))
+
+    def start(self):
+        """Reset the usage starting the clock."""
+        self.usage = {'time': 0.0, 'firings': 0, 'memory': 0}
+        self._start = time.monotonic()
+
+    def check(self, firings: int = 0, memory: int = None,
+              pending: bool = False):
+        """Account the given rule firings and memory in use.
+
+        Pending signals further rules are waiting to be fired.
+        Raise BudgetExceeded if any limit is exceeded.
+
+        """
+        self.usage['time'] = time.monotonic() - self._start
+        self.usage['firings'] += firings
+        if memory is not None:
+            self.usage['memory'] = max(self.usage['memory'], memory)
+
+        for name, limit in self.limits.items():
+            if not limit:
+                continue
+            if self.usage[name] > limit or (
+                    pending and name == 'firings' and
+                    self.usage[name] == limit):
+                raise BudgetExceeded(
+                    "Execution halted, %s budget of %s exceeded"
+                    % (name, UNITS[name](limit)))
+
+    def report(self) -> str:
+        """Usage of each budget in relation to its limit."""
+        return "Budget usage: " + ', '.join(
+            '%s %s/%s (%d%%)' % (name,
+                                 UNITS[name](self.usage[name]),
+                                 UNITS[name](limit),
+                                 100 * self.usage[name] / limit)
+            for name, limit in self.limits.items() if limit) + '\n'
+
+
+class BudgetWatchdog:
+    """Checks the time and memory budgets from a thread,
+    calling `halt` while they are exceeded.
+
+    Budgets are otherwise checked between commands: the watchdog
+    halts the long running ones.
+
+    """
+    def __init__(self, budget: Budget, halt: callable,
+                 memory: callable = None, interval: float = 0.05):
+        self._budget = budget
+        self._halt = halt
+        self._memory = memory
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _watch(self):
+        while not self._stopped.wait(self._interval):
+            memory = self._memory() if self._memory is not None else None
+            if self._budget.overrun(memory):
+                self._halt()
+
+
+def check_limits(limits: dict):
+    if any(limit < 0 for limit in limits.values()):
+        raise ValueError("Budget limits cannot be negative")
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes with an optional K, M or G suffix."""
+    size = size.strip().upper().rstrip('B')
+    multiplier = SIZE_SUFFIXES.get(size[-1:], 1)
+    if size[-1:] in SIZE_SUFFIXES:
+        size = size[:-1]
+
+    return int(float(size) * multiplier)
+
+
+def format_size(size: int) -> str:
+    for suffix in ('G', 'M', 'K'):
+        if size >= SIZE_SUFFIXES[suffix]:
+            return '%.1f%sB' % (size / SIZE_SUFFIXES[suffix], suffix)
+
+    return '%dB' % size
+
+
+SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+UNITS = {'time': lambda s: '%.2fs' % s,
+         'firings': lambda f: '%d' % f,
+         'memory': format_size}
@@ -14,19 +14,32 @@
 # along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
 
 
-import glob
+import os
+import re
+import time
+import uuid
+import shlex
+import signal
+import tempfile
+import threading
 import contextlib
 from io import StringIO
+from collections import deque
 from enum import IntEnum
 from traceback import format_exc
-from difflib import get_close_matches
 
-import clips
-import regex
+from traitlets import Bool, Float, Integer, Unicode
+from jupyter_core.paths import jupyter_data_dir
 from ipykernel.kernelbase import Kernel
+from IPython.core.error import StdinNotImplementedError
 
 from iclips import __version__
 from iclips.common import KEYWORDS, BUILTINS
+from iclips.tokenizer import IncrementalScanner, split_forms, head
+from iclips.completion import CompletionIndex, modifies_constructs
+from iclips.budget import Budget, BudgetExceeded, BudgetWatchdog, parse_size
+from iclips.metrics import KernelMetrics, MetricsServer, CommandMetrics
+from iclips.metrics import execution_metrics, command_label
 
 
 class CLIPSKernel(Kernel):
@@ -39,62 +52,303 @@ class CLIPSKernel(Kernel):
                      'mimetype': 'text/x-clips',
                      'codemirror_mode': 'clips'}
 
+    output_flush_size = Integer(
+        65536, help="Stream CLIPS output once it exceeds the given size."
+    ).tag(config=True)
+    output_flush_interval = Float(
+        0.1, help="Stream CLIPS output if older than the given seconds."
+    ).tag(config=True)
+    output_limit = Integer(
+        1048576, help="Characters of CLIPS output sent per cell, " +
+        "0 for no limit."
+    ).tag(config=True)
+    output_tail = Integer(
+        4096, help="Characters of truncated CLIPS output shown at its end."
+    ).tag(config=True)
+    run_slice = Integer(
+        1000, help="Rules fired by (run) between interruption checks, " +
+        "0 to run the agenda in a single call."
+    ).tag(config=True)
+    progress_interval = Float(
+        1.0, help="Seconds between (run) progress updates."
+    ).tag(config=True)
+    max_time = Float(
+        0, min=0, help="Wall clock seconds budget per cell, 0 for no limit."
+    ).tag(config=True)
+    max_firings = Integer(
+        0, min=0, help="Rule firings budget per cell, 0 for no limit."
+    ).tag(config=True)
+    max_memory = Integer(
+        0, min=0, help="CLIPS memory budget in bytes, 0 for no limit."
+    ).tag(config=True)
+    snapshot_dir = Unicode(
+        os.path.join(jupyter_data_dir(), 'iclips', 'snapshots'),
+        help="Directory where named snapshots are stored."
+    ).tag(config=True)
+    startup_snapshot = Unicode(
+        '', help="Name or path of the snapshot restored at kernel startup."
+    ).tag(config=True)
+    environment_pool_size = Integer(
+        2, help="Empty CLIPS environments kept ready for %%env new."
+    ).tag(config=True)
+    reply_metrics = Bool(
+        False, help="Attach the execution metrics to the execute replies."
+    ).tag(config=True)
+    reply_metrics_commands = Integer(
+        20, help="Slowest commands reported within the execution metrics."
+    ).tag(config=True)
+    metrics_port = Integer(
+        -1, help="Port of the Prometheus metrics endpoint on localhost, " +
+        "0 for any free port, -1 to disable it."
+    ).tag(config=True)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.cell_mode = CellMode.CLIPS
-        # I/O Routers
-        self.clips_input = InputRouter(self)
-        self.clips_output = OutputRouter()
-        # CLIPS Environment
-        self.environment = clips.Environment()
-        self.environment.add_router(self.clips_input)
-        self.environment.add_router(self.clips_output)
-        global_environment(self.environment)
+        self.code_scanner = IncrementalScanner()
+        self.budget = self.cell_budget = Budget(
+            self.max_time, self.max_firings, self.max_memory)
+        self.command_timings = []
+        self._environments = {}
+        self.environment_name = DEFAULT_ENVIRONMENT
+        self.environment_pool = []
+        self.pool_refill_scheduled = False
+        self.worker_pool = None
+        self.memory_page = None
+        self.function_options = {}
+        self.trace_options = None
+        self.firings = 0
+        self.command_metrics = []
+        self.cell_metrics = None
+        self.environment_state = None  # measured after the last execution
+        self.metrics = KernelMetrics()
+        self.metrics_server = None
+
+        if self.metrics_port >= 0:
+            self.metrics_server = MetricsServer(
+                self.metrics, self.metrics_port)
+            self.log.info("Metrics served at %s", self.metrics_server.url)
+
+    @property
+    def environments(self) -> dict:
+        """The kernel environments by name.
+
+        The default environment is created on first use, CLIPS is loaded
+        only once needed so that the kernel can reply to the frontend
+        handshake sooner.
+
+        """
+        if not self._environments:
+            self._environments[self.environment_name] = KernelEnvironment(
+                self, self.default_environment())
+
+            if self.startup_snapshot:
+                try:
+                    self.load_snapshot(self.startup_snapshot)
+                except RuntimeError as error:
+                    self.log.error("%s", error)
+
+            self.schedule_pool_refill()
+
+        return self._environments
+
+    @property
+    def clips(self):
+        """The clipspy module, imported on first use as it makes up
+        most of the kernel startup time.
+
+        """
+        import clips
+
+        return clips
+
+    @property
+    def kernel_environment(self) -> 'KernelEnvironment':
+        """The active environment."""
+        return self.environments[self.environment_name]
+
+    @property
+    def environment(self):
+        return self.kernel_environment.environment
+
+    @property
+    def clips_input(self):
+        return self.kernel_environment.clips_input
+
+    @property
+    def clips_output(self):
+        return self.kernel_environment.clips_output
+
+    @property
+    def completion_index(self) -> CompletionIndex:
+        return self.kernel_environment.completion_index
+
+    def default_environment(self):
+        """Return the CLIPS environment the kernel starts with."""
+        return self.clips.Environment()
+
+    def new_kernel_environment(self) -> 'KernelEnvironment':
+        """Return an empty environment, from the pool if any."""
+        if self.environment_pool:
+            return self.environment_pool.pop()
+
+        return KernelEnvironment(self, self.clips.Environment())
+
+    def schedule_pool_refill(self):
+        """Refill the environment pool once the current request is over.
+
+        Environments are created one per event loop iteration
+        not to delay the following requests.
+
+        """
+        io_loop = getattr(self, 'io_loop', None)  # set once started
+
+        if (io_loop is not None and not self.pool_refill_scheduled and
+                len(self.environment_pool) < self.environment_pool_size):
+            self.pool_refill_scheduled = True
+            io_loop.call_later(POOL_REFILL_DELAY, self.refill_environment_pool)
+
+    def refill_environment_pool(self):
+        """Add an empty environment to the pool."""
+        self.pool_refill_scheduled = False
+        if len(self.environment_pool) < self.environment_pool_size:
+            self.environment_pool.append(
+                KernelEnvironment(self, self.clips.Environment()))
+            self.schedule_pool_refill()
 
     def do_execute(
             self,
             code: str,
             silent: bool,
-            _store_history: bool=True,
-            _user_expressions: dict=None,
+            store_history: bool=True,
+            user_expressions: dict=None,
             allow_stdin: bool=False,
-            *_
+            *_args,
+            **_kwargs
     ) -> dict:
-        """Code execution request handler."""
+        """Code execution request handler.
+
+        The execution metrics are kept for the reply metadata.
+
+        """
         self._allow_stdin = allow_stdin
+        self.cell_metrics = None
 
         if not code.strip():
             return {'status': 'ok', 'execution_count': self.execution_count}
 
-        if code.startswith("%%"):
-            status = self.magic_cell(code, silent)
-        elif self.cell_mode == CellMode.CLIPS:
-            status = self.clips_code_cell(code, silent)
-        elif self.cell_mode in (CellMode.PYTHON, CellMode.DEFPYFUNCTION):
-            status = self.python_code_cell(code, silent)
-            self.cell_mode = CellMode.CLIPS
+        start = time.perf_counter()
+        self.command_metrics = []
+        firings = self.firings
+        if self.reply_metrics:
+            before = self.environment_state
+            if before is None or before[0] != self.environment_name:
+                before = self.measure_environment()
+
+        try:
+            if code.startswith("%%"):
+                status = self.magic_cell(code, silent)
+            elif self.cell_mode == CellMode.CLIPS:
+                status = self.clips_code_cell(code, silent)
+            elif self.cell_mode in (CellMode.PYTHON, CellMode.DEFPYFUNCTION):
+                status = self.python_code_cell(code, silent)
+                self.cell_mode = CellMode.CLIPS
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.observe('execute', elapsed)
+            self.sync_fact_indexes()
+
+        if self.reply_metrics:
+            after = self.environment_state = self.measure_environment()
+            self.cell_metrics = execution_metrics(
+                elapsed, self.firings - firings, (before[1], after[1]),
+                (before[2], after[2]), self.command_metrics,
+                self.reply_metrics_commands)
+        self.metrics.record(status['status'], self.firings - firings,
+                            self.cell_metrics)
 
         return status
 
+    def measure_environment(self) -> tuple:
+        """Return the name, the amount of facts and the memory used
+        of the active environment.
+
+        Counting the facts scans the whole fact list. CLIPS is not
+        loaded only to be measured: zeros are returned until then.
+
+        """
+        if not self._environments:
+            return self.environment_name, 0, 0
+
+        return self.environment_name, self.fact_count(), self.memory_used()
+
+    def sync_fact_indexes(self):
+        """Catch up the fact indexes of the active environment
+        with the watch flags the cell might have changed.
+
+        """
+        environment = self._environments.get(self.environment_name)
+        if environment is not None and environment.fact_indexes is not None:
+            environment.fact_indexes.sync()
+
+    def finish_metadata(self, parent, metadata: dict,
+                        reply_content: dict) -> dict:
+        """Attach the execution metrics to the execute reply metadata."""
+        if self.cell_metrics is not None:
+            metadata['iclips'] = self.cell_metrics
+            self.cell_metrics = None
+
+        return metadata
+
     def do_complete(self, code: str, cursor: int) -> int:
         """Code completion request handler."""
+        start = time.perf_counter()
+
+        try:
+            return self.complete(code, cursor)
+        finally:
+            self.metrics.observe('complete', time.perf_counter() - start)
+
+    def do_is_complete(self, code: str) -> dict:
+        """Newline continuation checker."""
+        start = time.perf_counter()
+
+        try:
+            return self.is_complete(code)
+        finally:
+            self.metrics.observe('is_complete', time.perf_counter() - start)
+
+    def do_shutdown(self, restart: bool) -> dict:
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.worker_pool is not None:
+            self.worker_pool[1].shutdown(cancel_futures=True)
+            self.worker_pool = None
+
+        return {'status': 'ok', 'restart': restart}
+
+    def complete(self, code: str, cursor: int) -> dict:
+        from difflib import get_close_matches
+
         token = code[:cursor].split()[-1].strip('()"')
         completion = self.completion_list(code, token)
 
-        matches = [m for m in
-                   get_close_matches(token, completion, n=100, cutoff=0.1)
-                   if m.startswith(token)]
+        matches = get_close_matches(token, completion, n=100, cutoff=0.1)
 
         return {'status': 'ok',
                 'cursor_start': cursor - len(token),
                 'cursor_end': cursor,
                 'matches': matches}
 
-    def do_is_complete(self, code: str) -> dict:
-        """Newline continuation checker."""
+    def is_complete(self, code: str) -> dict:
         if self.cell_mode == CellMode.CLIPS:
             indent = '  '
-            status = 'complete' if even_parenthesis(code) else 'incomplete'
+            scanner = self.code_scanner.scan(code)
+            if scanner.unbalanced:
+                status = 'invalid'
+            else:
+                status = 'complete' if scanner.complete else 'incomplete'
         elif self.cell_mode in (CellMode.PYTHON, CellMode.DEFPYFUNCTION):
             indent = ''
             status = 'complete' if code.endswith('\n\n') else 'incomplete'
@@ -102,54 +356,781 @@ class CLIPSKernel(Kernel):
         return {'status': status, 'indent': indent}
 
     def magic_cell(self, code: str, silent: bool, *_) -> dict:
-        """Handle a cell containing Magic commands."""
+        """Handle a cell containing Magic commands.
+
+        The first line contains the Magic command and its arguments,
+        the rest of the cell is handed over to the command as its body.
+
+        """
         status = 'ok'
-        magic = code.lstrip('%').strip()
-
-        if magic == 'python':
-            self.cell_mode = CellMode.PYTHON
-            text = "Python mode: return twice to execute the inserted code.\n"
-        elif magic == 'define-python-function':
-            self.cell_mode = CellMode.DEFPYFUNCTION
-            text = "DefPyFunction mode: return twice " + \
-                   "to define the inserted function within CLIPS.\n"
-        else:
+        line, _, body = code.partition('\n')
+
+        try:
+            magic, *arguments = shlex.split(line.lstrip('%')) or ['']
+            if magic not in MAGIC_COMMANDS:
+                raise RuntimeError("Unrecognised magic command")
+
+            handler = getattr(self, 'magic_' + magic.replace('-', '_'))
+            text = handler(arguments, body, silent)
+        except (RuntimeError, LookupError, ValueError) as error:
             status = 'error'
-            text = "Unrecognised magic command\n"
+            text = '%s\n' % error if str(error) else ''
+
+        if not silent and text:
+            self.send_stream(text)
+
+        return {'status': status, 'execution_count': self.execution_count}
+
+    def magic_python(self, *_) -> str:
+        self.cell_mode = CellMode.PYTHON
+
+        return "Python mode: return twice to execute the inserted code.\n"
+
+    def magic_define_python_function(self, arguments: list, _body: str,
+                                     silent: bool) -> str:
+        """Define the function within the next cell within CLIPS.
+
+        %%define-python-function [cache=<entries>] [ttl=<seconds>]
+                                 [batch=<arguments>]
+        %%define-python-function stats
+
+        With `cache`, the results are memoized by their arguments.
+        With `batch`, the function takes a list of argument tuples.
+
+        """
+        from iclips.functions import cache_table
+
+        if arguments == ['stats']:
+            functions = {n: f for n, f in
+                         self.kernel_environment.python_wrappers.items()
+                         if getattr(f, 'cache', None) is not None}
+            if not silent:
+                self.send_display(cache_table(functions))
+
+            return ''
+
+        _, options = magic_arguments(arguments, 0, 'cache', 'ttl', 'batch')
+        self.function_options = {'cache': int(options['cache'])
+                                 if 'cache' in options else None,
+                                 'ttl': float(options['ttl'])
+                                 if 'ttl' in options else None,
+                                 'batch': int(options['batch'])
+                                 if 'batch' in options else None}
+        if any(self.function_options[o] is not None and
+               self.function_options[o] <= 0 for o in options):
+            raise RuntimeError("Options must be positive")
+        if self.function_options['ttl'] is not None and \
+           self.function_options['cache'] is None:
+            raise RuntimeError("TTL requires a cache size")
+        self.cell_mode = CellMode.DEFPYFUNCTION
+
+        return "DefPyFunction mode: return twice " + \
+               "to define the inserted function within CLIPS.\n"
+
+    def magic_load_data(self, arguments: list, *_) -> str:
+        """Assert the rows of a CSV, JSON or JSON Lines file
+        as template facts.
+
+        %%load-data <template> <file>
 
+        """
+        from iclips.data import load_data
+
+        (name, path), _ = magic_arguments(arguments, 2)
+        template = self.environment.find_template(name)
+
+        try:
+            report = load_data(template, path)
+        except OSError as error:
+            raise RuntimeError("Unable to read %s: %s" % (path, error))
+
+        return str(report)
+
+    def magic_budget(self, arguments: list, body: str, silent: bool) -> str:
+        """Set the execution budgets.
+
+        %%budget [time=<seconds>] [firings=<count>] [memory=<size>]
+
+        If the cell contains CLIPS code, the budgets apply to it only.
+        Otherwise, they apply to all the following cells.
+
+        """
+        _, options = magic_arguments(arguments, 0, *BUDGET_LIMITS)
+        limits = {name: BUDGET_LIMITS[name](value)
+                  for name, value in options.items()}
+
+        if body.strip():
+            reply = self.clips_code_cell(
+                body, silent, budget=self.budget.copy(**limits))
+            if reply['status'] == 'error':
+                raise ExecutionError('')
+
+            return ''
+
+        self.budget = self.budget.copy(**limits)
+
+        return str(self.budget) + '\n'
+
+    def magic_trace(self, arguments: list, body: str, silent: bool) -> str:
+        """Aggregate the CLIPS watch traces instead of displaying them.
+
+        %%trace [tail=<lines>] [sample=<n>]
+        %%trace off
+
+        The trace lines are counted by event and by rule, template
+        or function. The counts and the last `tail` trace lines are shown
+        at the end of each cell. With `sample`, one trace line every
+        `sample` is displayed.
+
+        If the cell contains CLIPS code, the traces are aggregated
+        within it only. Otherwise, within all the following cells.
+
+        """
+        if arguments == ['off']:
+            self.trace_options = None
+            return "Trace aggregation disabled\n"
+
+        _, options = magic_arguments(arguments, 0, 'tail', 'sample')
+        trace = {name: int(value) for name, value in options.items()}
+        if any(value < 0 for value in trace.values()):
+            raise ValueError("Trace options cannot be negative")
+
+        if body.strip():
+            reply = self.clips_code_cell(body, silent, trace=trace)
+            if reply['status'] == 'error':
+                raise ExecutionError('')
+
+            return ''
+
+        self.trace_options = trace
+
+        return "Trace aggregation enabled\n"
+
+    def magic_profile(self, arguments: list, body: str, silent: bool) -> str:
+        """Profile the execution of the CLIPS code within the cell.
+
+        %%profile [sort=time|kids|entries|name]
+
+        """
+        from iclips.profiling import PROFILE_SORT
+        from iclips.profiling import parse_profile_info, profile_tables
+
+        _, options = magic_arguments(arguments, 0, 'sort')
+        sort = options.get('sort', 'time')
+        if sort not in PROFILE_SORT:
+            raise ValueError("Unknown sorting column %s" % sort)
+        if not body.strip():
+            raise RuntimeError("No CLIPS code to profile")
+
+        python_functions = self.kernel_environment.python_functions
+        for function in python_functions.values():
+            function.reset()
+            function.active = True
+
+        self.environment.eval('(profile-reset)')
+        self.environment.eval('(profile constructs)')
+        try:
+            reply = self.clips_code_cell(body, silent)
+        finally:
+            self.environment.eval('(profile off)')
+            for function in python_functions.values():
+                function.active = False
+
+        entries = parse_profile_info(
+            self.captured_output(self.environment.eval, '(profile-info)'))
         if not silent:
-            stream = {'name': 'stdout', 'text': text}
+            for data in profile_tables(entries, python_functions,
+                                       self.command_timings, sort=sort):
+                self.send_display(data)
 
-            self.send_response(self.iopub_socket, 'stream', stream)
+        if reply['status'] == 'error':
+            raise ExecutionError('')
 
-        return {'status': status, 'execution_count': self.execution_count}
+        return ''
 
-    def clips_code_cell(self, code: str, silent: bool, *_) -> dict:
-        """Handle a code cell containing CLIPS code."""
-        output = ''
+    def magic_rete_stats(self, arguments: list, body: str,
+                         silent: bool) -> str:
+        """Show the partial matches of each rule ranked by their amount.
+
+        %%rete-stats [top=<rules>]
+
+        If the cell contains CLIPS code, the growth of the matches
+        caused by its execution is shown. Otherwise, the growth since
+        the previous statistics.
+
+        """
+        from iclips.rete import rete_table
+
+        _, options = magic_arguments(arguments, 0, 'top')
+        top = int(options['top']) if 'top' in options else None
+        kernel_environment = self.kernel_environment
         status = 'ok'
-        uncommented_code = regex.sub(r';.*', '', code)
-        commands = regex.findall(PARENTHESES_REGEX, uncommented_code)
 
-        for command in commands:
-            try:
-                result = self.execute_clips_code(command.strip())
-                output += self.clips_output.output + '\n' + str(result)
-            except RuntimeError:
-                status = 'error'
-                output += self.clips_output.output
+        if body.strip():
+            kernel_environment.rete_matches = self.rules_matches()
+            status = self.clips_code_cell(body, silent)['status']
 
+        matches = self.rules_matches()
         if not silent:
-            stream = {'name': 'stdout', 'text': output.strip()}
+            self.send_display(
+                rete_table(matches, kernel_environment.rete_matches, top))
+        kernel_environment.rete_matches = matches
+
+        if status == 'error':
+            raise ExecutionError('')
+
+        return ''
+
+    def magic_env(self, arguments: list, *_) -> str:
+        """Manage the CLIPS environments within the kernel.
 
-            self.send_response(self.iopub_socket, 'stream', stream)
+        %%env [new|use|drop <name>]
+
+        Without arguments, the environments are listed.
+
+        """
+        if not arguments:
+            return ''.join('%s %s\n' % ('*' if n == self.environment_name
+                                         else ' ', n)
+                           for n in sorted(self.environments))
+
+        (action, name), _ = magic_arguments(arguments, 2)
+        if action == 'new':
+            self.create_environment(name)
+        elif action == 'use':
+            self.use_environment(name)
+        elif action == 'drop':
+            self.drop_environment(name)
+        else:
+            raise ValueError("Unknown environment action %s" % action)
+
+        return ''
+
+    def create_environment(self, name: str):
+        """Create a new empty environment and make it the active one."""
+        if name in self.environments:
+            raise RuntimeError("Environment %s already exists" % name)
+
+        self.environments[name] = self.new_kernel_environment()
+        self.environment_name = name
+        self.schedule_pool_refill()
+
+    def use_environment(self, name: str):
+        """Make the given environment the active one."""
+        if name not in self.environments:
+            raise LookupError("No environment named %s" % name)
+
+        self.environment_name = name
+
+    def drop_environment(self, name: str):
+        """Discard the given environment, it cannot be the active one."""
+        if name not in self.environments:
+            raise LookupError("No environment named %s" % name)
+        if name == self.environment_name:
+            raise RuntimeError("Cannot drop the active environment")
+
+        del self.environments[name]
+
+    def magic_parallel(self, arguments: list, _body: str,
+                       silent: bool) -> str:
+        """Run the agenda over the template facts in parallel.
+
+        %%parallel <template> <slot> [workers=<n>] [partitions=<n>]
+
+        The template facts are partitioned by the value of the slot.
+
+        """
+        from iclips.parallel import evaluate_partitions
+
+        (template, key), options = magic_arguments(
+            arguments, 2, 'workers', 'partitions')
+        workers = int(options.get('workers', os.cpu_count()))
+        partitions = int(options.get('partitions', workers))
+        if workers < 1 or partitions < 1:
+            raise ValueError("Workers and partitions must be positive")
+
+        try:
+            with self.streaming_output(silent):
+                report = evaluate_partitions(
+                    self.environment, self.parallel_executor(workers),
+                    template, key, partitions, workers)
+        except (self.clips.CLIPSError, TypeError) as error:
+            self.clips_output.reset()
+            raise RuntimeError("Parallel evaluation failed: %s" % error)
+
+        if not silent:
+            for data in report.tables():
+                self.send_display(data)
+
+        return str(report)
+
+    def parallel_executor(self, workers: int):
+        """Return the worker processes pool, resized if needed."""
+        from iclips.parallel import worker_pool
+
+        if self.worker_pool is None or self.worker_pool[0] != workers:
+            if self.worker_pool is not None:
+                self.worker_pool[1].shutdown()
+            self.worker_pool = workers, worker_pool(workers)
+
+        return self.worker_pool[1]
+
+    def magic_facts(self, arguments: list, _body: str, silent: bool) -> str:
+        """Display a page of the facts within the environment.
+
+        %%facts [template=<name>] [sort=<key>] [page=<n>] [size=<rows>]
+        %%facts next|previous
+
+        """
+        return self.display_memory_page('facts', 'template', arguments, silent)
+
+    def magic_instances(self, arguments: list, _body: str,
+                        silent: bool) -> str:
+        """Display a page of the instances within the environment.
+
+        %%instances [class=<name>] [sort=<key>] [page=<n>] [size=<rows>]
+        %%instances next|previous
+
+        """
+        return self.display_memory_page(
+            'instances', 'class', arguments, silent)
+
+    def display_memory_page(self, kind: str, name: str, arguments: list,
+                            silent: bool) -> str:
+        """Display the requested page of facts or instances.
+
+        The next and previous pages update the display of the last one.
+
+        """
+        from iclips.browser import MemoryPage
+
+        if arguments and arguments[0] in ('next', 'previous'):
+            magic_arguments(arguments, 1)
+            if self.memory_page is None or self.memory_page[0].kind != kind:
+                raise RuntimeError("No %s page displayed" % kind)
+
+            page, display_id = self.memory_page
+            page.page = max(1, page.page + (
+                1 if arguments[0] == 'next' else -1))
+            update = True
+        else:
+            _, options = magic_arguments(arguments, 0, name, 'sort',
+                                         'page', 'size')
+            page = MemoryPage(kind, options.get(name), options.get('sort'),
+                              int(options.get('page', 1)),
+                              int(options.get('size', 50)))
+            display_id = uuid.uuid4().hex
+            update = False
+
+        data = page.display(self.environment)
+        self.memory_page = page, display_id
+        if not silent:
+            self.send_display(data, display_id, update=update)
+
+        return ''
+
+    def magic_columnar(self, arguments: list, *_) -> str:
+        """Exchange facts or instances with DataFrames or Arrow tables.
+
+        %%columnar export|import <template|class> <variable>
+                   [format=pandas|arrow]
+
+        The variable is read from or written into the Python namespace.
+
+        """
+        from iclips import columnar
+
+        (action, name, variable), options = magic_arguments(
+            arguments, 3, 'format')
+        table_format = options.get('format', 'pandas')
+        if action not in ('export', 'import'):
+            raise ValueError("Unknown columnar action %s" % action)
+        if table_format not in COLUMNAR_FORMATS:
+            raise ValueError("Unknown columnar format %s" % table_format)
+
+        exporter, importer = COLUMNAR_FORMATS[table_format]
+        start = time.perf_counter()
+
+        try:
+            if action == 'export':
+                table = getattr(columnar, exporter)(self.environment, name)
+                globals()[variable] = table
+                count = len(table)
+            else:
+                if variable not in globals():
+                    raise LookupError("No Python variable named %s" % variable)
+                count = getattr(columnar, importer)(
+                    self.environment, name, globals()[variable])
+        except ImportError as error:
+            raise RuntimeError("Columnar format %s requires %s"
+                               % (table_format, error.name))
+        except (TypeError, ValueError, self.clips.CLIPSError) as error:
+            messages = self.clips_output.output.strip()  # CLIPS errors
+            raise RuntimeError("Unable to %s %s: %s%s" % (
+                action, name, error, '\n' + messages if messages else ''))
+
+        return "%s %d rows %s %s in %.3f seconds\n" % (
+            action.capitalize() + 'ed', count,
+            'into' if action == 'export' else 'from', variable,
+            time.perf_counter() - start)
+
+    def magic_query(self, arguments: list, _body: str, silent: bool) -> str:
+        """Look up facts by slot value through secondary indexes.
+
+        %%query index|drop <template> <slot>
+        %%query <template> <slot> [value=<v>] [low=<v>] [high=<v>]
+                [size=<rows>]
+        %%query
+
+        Without arguments, the indexes are listed.
+
+        """
+        from iclips.display import table
+        from iclips.query import FactIndexes, fact_values, query_value
+        from iclips.query import display_value, facts_label
+
+        indexes = self.kernel_environment.fact_indexes
+        if indexes is None:
+            indexes = FactIndexes(self.environment)
+            self.kernel_environment.fact_indexes = indexes
+
+        if not arguments:
+            return ''.join("%s %s: %s\n" % (i.template, i.slot,
+                                             facts_label(len(i)))
+                           for i in indexes.indexes)
+
+        if arguments[0] in ('index', 'drop'):
+            (action, template, slot), _ = magic_arguments(arguments, 3)
+            if action == 'drop':
+                indexes.drop(template, slot)
+                return "Dropped index on %s %s\n" % (template, slot)
+
+            start = time.perf_counter()
+            index = indexes.create(template, slot)
+            return "Indexed %s of %s by %s in %.3f seconds\n" % (
+                facts_label(len(index)), template, slot,
+                time.perf_counter() - start)
+
+        (template, slot), options = magic_arguments(
+            arguments, 2, 'value', 'low', 'high', 'size')
+        size = int(options.get('size', 50))
+
+        start = time.perf_counter()
+        index = indexes.index(template, slot)
+        deftemplate = self.environment.find_template(template)
+        types = next(s.types for s in deftemplate.slots if s.name == slot)
+        values = {k: query_value(types, v) for k, v in options.items()
+                  if k != 'size'}
+        if 'value' in values:
+            facts = index.lookup(values['value'])
+            condition = "%s = %s" % (slot, options['value'])
+        else:
+            facts = index.range(values.get('low'), values.get('high'))
+            condition = "%s in %s..%s" % (slot, options.get('low', ''),
+                                          options.get('high', ''))
+        elapsed = time.perf_counter() - start
+
+        if not silent:
+            names = tuple(s.name for s in deftemplate.slots)
+            rows = [('f-%d' % f,) + tuple(display_value(v) for v in values)
+                    for f, values in zip(facts, fact_values(
+                        self.environment, template, facts[:size]))]
+            self.send_display(table(
+                ('Fact',) + names, rows, title="%s of %s with %s%s" % (
+                    facts_label(len(facts)), template, condition,
+                    ", first %d shown" % size if len(facts) > size else '')))
+
+        return "Looked up %s in %.6f seconds\n" % (
+            facts_label(len(facts)), elapsed)
+
+    def magic_stdin(self, arguments: list, body: str, _silent: bool) -> str:
+        """Queue the input read by CLIPS instead of requesting it.
+
+        %%stdin [<file>]
+        %%stdin clear
+
+        The input is read from the file, if given, followed by the cell
+        content. Once consumed, the input is requested to the frontend.
+
+        """
+        if arguments == ['clear']:
+            self.clips_input.clear()
+            return "Queued input discarded\n"
+
+        paths, _ = magic_arguments(arguments, min(len(arguments), 1))
+        for path in paths:
+            try:
+                with open(path) as input_file:
+                    self.clips_input.feed(input_file.read())
+            except OSError as error:
+                raise RuntimeError("Unable to read %s: %s" % (path, error))
+        if body:
+            self.clips_input.feed(body if body.endswith('\n') else body + '\n')
+
+        return "%d characters of input queued\n" % self.clips_input.queued
+
+    def magic_snapshot(self, arguments: list, _body: str,
+                       silent: bool) -> str:
+        """Save or restore a binary image of the CLIPS environment.
+
+        %%snapshot save|load <name>
+
+        The name can also be the path of the snapshot directory.
+
+        """
+        (action, name), _ = magic_arguments(arguments, 2)
+        if action not in ('save', 'load'):
+            raise ValueError("Unknown snapshot action %s" % action)
+
+        start = time.perf_counter()
+        with self.streaming_output(silent):
+            if action == 'save':
+                path = self.save_snapshot(name)
+            else:
+                path = self.load_snapshot(name)
+
+        return "Snapshot %s %s in %.3f seconds\n" % (
+            path, 'saved' if action == 'save' else 'loaded',
+            time.perf_counter() - start)
+
+    def save_snapshot(self, name: str) -> str:
+        """Save the environment binary image returning its path."""
+        from iclips.snapshot import save_snapshot
+
+        path = self.snapshot_path(name)
+
+        try:
+            save_snapshot(self.environment, path)
+        except (OSError, self.clips.CLIPSError) as error:
+            self.clips_output.reset()
+            raise RuntimeError("Unable to save snapshot %s: %s"
+                               % (path, error))
+
+        return path
+
+    def load_snapshot(self, name: str) -> str:
+        """Restore the environment binary image returning its path.
+
+        As after a CLIPS (bload), new constructs cannot be defined
+        until the environment is cleared.
+
+        """
+        from iclips.snapshot import load_snapshot
+
+        path = self.snapshot_path(name)
+
+        try:
+            load_snapshot(self.environment, path)
+        except (OSError, self.clips.CLIPSError) as error:
+            self.clips_output.reset()
+            raise RuntimeError("Unable to load snapshot %s: %s"
+                               % (path, error))
+        finally:
+            self.completion_index.invalidate()
+
+        return path
+
+    def snapshot_path(self, name: str) -> str:
+        if os.sep in name:
+            return os.path.abspath(os.path.expanduser(name))
+
+        return os.path.join(self.snapshot_dir, name)
+
+    def clips_code_cell(self, code: str, silent: bool,
+                        budget: Budget = None, trace: dict = None) -> dict:
+        """Handle a code cell containing CLIPS code.
+
+        The execution is halted if it exceeds the given budget,
+        the kernel one if None. The watch traces are aggregated
+        with the given options, the kernel ones if None.
+
+        """
+        status = 'ok'
+        self.command_timings = []
+        self.cell_budget = budget if budget is not None else self.budget
+        self.cell_budget.start()
+        trace = trace if trace is not None else self.trace_options
+
+        with self.streaming_output(silent), self.budget_watchdog(), \
+                self.aggregated_traces(trace) as aggregator:
+            for form in split_forms(code):
+                start = time.perf_counter()
+                firings = self.firings
+                memory = self.memory_used() if self.reply_metrics else 0
+
+                try:
+                    result = self.execute_clips_code(form.code)
+                    if result:
+                        self.clips_output.append(result + '\n')
+                    self.check_budget()
+                except BudgetExceeded as error:
+                    status = 'error'
+                    self.clips_output.append(str(error) + '\n')
+                    break
+                except ExecutionError as error:
+                    status = 'error'
+                    self.clips_output.append(str(error) + '\n')
+                except RuntimeError:
+                    status = 'error'
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.command_timings.append((form.code, elapsed))
+                    self.command_metrics.append(CommandMetrics(
+                        len(self.command_metrics), command_label(form.code),
+                        elapsed, self.firings - firings,
+                        self.memory_used() - memory
+                        if self.reply_metrics else 0))
+                    if modifies_constructs(form.head):
+                        self.completion_index.invalidate()
+
+                self.clips_output.flush()
+
+            if self.cell_budget.active:
+                self.clips_output.append(self.cell_budget.report())
+
+        if aggregator is not None and aggregator.lines and not silent:
+            self.send_display(aggregator.summary())
+            if aggregator.tail:
+                self.send_stream(aggregator.tail_text())
 
         return {'status': status, 'execution_count': self.execution_count}
 
+    def check_budget(self, firings: int = 0, pending: bool = False):
+        """Check the budget of the current cell."""
+        budget = self.cell_budget
+        memory = self.memory_used() if budget.limits['memory'] else None
+
+        budget.check(firings, memory, pending)
+
+    @contextlib.contextmanager
+    def budget_watchdog(self):
+        """Halt CLIPS within the context once the current cell exceeds
+        its time or memory budget.
+
+        """
+        budget = self.cell_budget
+        if not budget.limits['time'] and not budget.limits['memory']:
+            yield
+            return
+
+        halt, memory = clips_halt_functions(self.environment)
+        watchdog = BudgetWatchdog(
+            budget, halt, memory if budget.limits['memory'] else None)
+        watchdog.start()
+
+        try:
+            yield
+        finally:
+            watchdog.stop()
+
+    def rules_matches(self) -> dict:
+        """Return the matches of each rule within the environment."""
+        from iclips.rete import parse_matches
+
+        matches = {}
+
+        for rule in self.environment.rules():
+            text = self.captured_output(
+                rule.matches, self.clips.Verbosity.SUCCINT)
+            matches[rule.name] = parse_matches(rule.name, text)
+
+        return matches
+
+    def captured_output(self, function: callable, *arguments) -> str:
+        """Call the function returning the output it produced within CLIPS."""
+        self.clips_output.flush()
+        callback = self.clips_output.callback
+        self.clips_output.callback = None
+
+        try:
+            function(*arguments)
+
+            return self.clips_output.output
+        finally:
+            self.clips_output.callback = callback
+
+    def memory_used(self) -> int:
+        """Return the amount of memory in use by CLIPS."""
+        return self.environment.call('mem-used')
+
+    def fact_count(self) -> int:
+        """Return the amount of facts within the environment."""
+        return self.environment.eval('(length$ (get-fact-list *))')
+
+    @contextlib.contextmanager
+    def streaming_output(self, silent: bool):
+        """Stream the CLIPS output to the frontend within the context.
+
+        If silent, the output is discarded.
+        If the output exceeds the configured limit,
+        it is spilled into a temporary file and truncated.
+
+        """
+        spool = None
+
+        if silent:
+            self.clips_output.callback = lambda _: None
+        elif self.output_limit > 0:
+            spool = OutputSpool(
+                self.send_stream, self.output_limit, self.output_tail)
+            self.clips_output.callback = spool.write
+        else:
+            self.clips_output.callback = self.send_stream
+
+        try:
+            yield self.clips_output
+        finally:
+            self.clips_output.flush()
+            self.clips_output.callback = None
+            if spool is not None:
+                spool.close()
+
+    @contextlib.contextmanager
+    def aggregated_traces(self, options: dict):
+        """Aggregate the watch traces within the context.
+
+        Yields the trace aggregator, None if options are None.
+
+        """
+        from iclips.trace import TraceAggregator
+
+        if options is None:
+            yield None
+            return
+
+        aggregator = TraceAggregator(**options)
+        self.clips_output.aggregator = aggregator
+
+        try:
+            yield aggregator
+        finally:
+            self.clips_output.aggregator = None
+            text = aggregator.close()
+            if text:
+                self.clips_output.append(text)
+
+    def send_stream(self, text: str, name: str = 'stdout'):
+        """Send the given text to the frontend."""
+        stream = {'name': name, 'text': text}
+
+        self.send_response(self.iopub_socket, 'stream', stream)
+
+    def input_line(self) -> str:
+        """Request a line of input to the frontend.
+
+        Returns None if the frontend does not support input requests.
+
+        """
+        try:
+            return self.raw_input()
+        except StdinNotImplementedError:
+            return None
+
     def python_code_cell(self, code: str, silent: bool, *_) -> dict:
         """Handle a code cell containing Python code."""
         output = ''
         status = 'ok'
+        global_environment(self.environment)
 
         with capture_python_output() as python_output:
             try:
@@ -161,138 +1142,384 @@ class CLIPSKernel(Kernel):
                 status = 'error'
                 output = format_exc()
 
+        self.completion_index.invalidate()
         output = python_output.getvalue() + '\n' + output
 
         if not silent:
-            stream = {'name': 'stdout', 'text': output}
-
-            self.send_response(self.iopub_socket, 'stream', stream)
+            self.send_stream(output)
 
         return {'status': status, 'execution_count': self.execution_count}
 
     def define_python_function(self, code: str) -> tuple:
-        match = regex.search(FUNCNAME_REGEX, code)
+        from iclips.profiling import ProfiledFunction
+        from iclips.functions import ResultCache
+        from iclips.functions import MemoizedFunction, BatchedFunction
+
+        match = re.search(FUNCNAME_REGEX, code)
+        options, self.function_options = self.function_options, {}
 
         try:
             funcname = match.group(1)
-            function = globals()[funcname]
-
-            self.environment.define_function(function)
+            function = wrapper = ProfiledFunction(globals()[funcname])
+            cache = ResultCache(options['cache'], options['ttl']) \
+                if options.get('cache') is not None else None
+
+            if options.get('batch') is not None:
+                wrapper = BatchedFunction(function, options['batch'], cache)
+            elif cache is not None:
+                wrapper = MemoizedFunction(function, cache)
+
+            self.environment.define_function(wrapper, funcname)
+            self.kernel_environment.python_functions[funcname] = function
+            self.kernel_environment.python_wrappers[funcname] = wrapper
         except (LookupError, AttributeError):
             raise RuntimeError("No function definition found")
-        except clips.CLIPSError as error:
+        except self.clips.CLIPSError as error:
             self.clips_output.reset()
             raise RuntimeError("Unable to define function in CLIPS") from error
 
     def execute_clips_code(self, code: str) -> str:
         """Evaluate CLIPS code."""
         result = None
-        function = code.strip('()').split()[0]
+        function = head(code)
 
         try:
             if function in DEFCONSTRUCTS:
                 self.environment.build(code)
+            elif function == 'run' and self.run_slice > 0:
+                self.run_agenda(self.run_limit(code))
+            elif function == 'run':
+                self.run_unsliced(self.run_limit(code))
+            elif function in WATCH_COMMANDS:
+                with self.user_watch():
+                    result = self.environment.eval(code)
             else:
                 result = self.environment.eval(code)
-        except clips.CLIPSError as error:
+        except self.clips.CLIPSError as error:
             raise RuntimeError(error)
 
         return str(result) if result is not None else ''
 
+    @contextlib.contextmanager
+    def user_watch(self):
+        """Show the watch flags as set by the user within the context,
+        the fact indexes keep the indexed templates watched otherwise.
+
+        """
+        indexes = self.kernel_environment.fact_indexes
+
+        if indexes is None:
+            yield
+        else:
+            with indexes.user_watch():
+                yield
+
+    def run_limit(self, code: str) -> int:
+        """Return the limit of rule firings of the given (run) command."""
+        arguments = split_forms(code.strip()[1:-1])[1:]
+
+        if not arguments:
+            return None
+        if len(arguments) > 1:
+            raise ExecutionError("Function run expected at most 1 argument")
+
+        limit = self.environment.eval(arguments[0].code)
+        if not isinstance(limit, int):
+            raise ExecutionError("Function run expected argument #1 "
+                               "to be of type integer")
+
+        return limit if limit >= 0 else None
+
+    def run_unsliced(self, limit: int = None) -> int:
+        """Run the agenda at once within the firings budget."""
+        remaining = self.cell_budget.remaining_firings
+        if remaining is not None:
+            limit = remaining if limit is None else min(limit, remaining)
+
+        fired = self.environment.run(limit)
+        self.firings += fired
+        pending = fired == limit and \
+            next(self.environment.activations(), None) is not None
+        self.check_budget(firings=fired, pending=pending)
+
+        return fired
+
+    def run_agenda(self, limit: int = None) -> int:
+        """Run the agenda in slices of `run_slice` rule firings.
+
+        Between slices, interruption requests and budgets are checked
+        and the execution progress is published.
+
+        """
+        fired = 0
+        progress = RunProgress(self)
+
+        with interruption() as interrupted:
+            try:
+                while limit is None or fired < limit:
+                    size = self.run_slice
+                    if limit is not None:
+                        size = min(size, limit - fired)
+                    remaining = self.cell_budget.remaining_firings
+                    if remaining is not None:
+                        size = min(size, remaining)
+
+                    if size == 0:
+                        pending = next(self.environment.activations(), None)
+                        self.check_budget(pending=pending is not None)
+                        break
+
+                    count = self.environment.run(size)
+                    fired += count
+                    self.firings += count
+                    self.check_budget(firings=count)
+                    if count < size:
+                        break
+
+                    if interrupted.is_set():
+                        raise ExecutionError("Execution interrupted after %d "
+                                             "rule firings" % fired)
+                    if progress.expired:
+                        progress.update(fired)
+                        self.clips_output.flush()
+            finally:
+                progress.close(fired)
+
+        return fired
+
+    def send_display(self, data: dict, display_id: str = None,
+                     update: bool = False):
+        """Send the given data to the frontend.
+
+        If a display_id is given, the display can be later updated.
+
+        """
+        content = {'data': data, 'metadata': {}}
+        if display_id is not None:
+            content['transient'] = {'display_id': display_id}
+        message = 'update_display_data' if update else 'display_data'
+
+        self.send_response(self.iopub_socket, message, content)
+
     def completion_list(self, code: str, token: str) -> list:
-        """Return a list of completion candidates."""
-        completion = list(COMPLETION)
-        completion += [t for t in code.strip('()').split() if t != token]
+        """Return a list of completion candidates starting with token."""
+        import glob
 
-        classes = list(self.environment.classes())
-        completion.extend((c.name for c in classes))
-        completion.extend((s.name for c in classes for s in c.slots()))
+        completion = set(self.completion_index.lookup(token))
+        completion.update(t for t in code.strip('()').split()
+                          if t != token and t.startswith(token))
+        completion.update(glob.glob(token + '*'))
 
-        templates = list(self.environment.templates())
-        completion.extend((t.name for t in templates))
-        completion.extend((s.name for t in templates for s in t.slots))
+        return list(completion)
 
-        completion.extend((g.name for g in self.environment.generics()))
-        completion.extend((f.name for f in self.environment.functions()))
-        completion.extend((g.name for g in self.environment.globals()))
-        completion.extend(glob.glob(token + '*'))
 
-        return completion
+class KernelEnvironment:
+    """A CLIPS environment with its own I/O routers and kernel state."""
+    def __init__(self, kernel: CLIPSKernel, environment):
+        from iclips.routers import InputRouter, OutputRouter
 
+        self.environment = environment
+        self.clips_input = InputRouter(kernel)
+        self.clips_output = OutputRouter(
+            kernel.output_flush_size, kernel.output_flush_interval)
+        self.environment.add_router(self.clips_input)
+        self.environment.add_router(self.clips_output)
+        self.completion_index = CompletionIndex(environment, COMPLETION)
+        self.python_functions = {}
+        self.python_wrappers = {}
+        self.rete_matches = {}
+        self.fact_indexes = None
+
+
+class ExecutionError(RuntimeError):
+    """Error raised by the kernel while executing CLIPS code."""
+
+
+class RunProgress:
+    """Progress of the agenda execution published as an updatable display.
 
-class InputRouter(clips.Router):
-    """CLIPS Router for capturing input requests."""
-    def __init__(self, kernel):
-        super().__init__('iclips-input-router', 40)
-        self._input = None
+    The display is created only if the execution lasts longer
+    than the kernel progress interval.
+
+    """
+    def __init__(self, kernel: CLIPSKernel):
         self._kernel = kernel
+        self._display_id = None
+        self._start = self._updated = time.monotonic()
 
-    def query(self, name: str) -> bool:
-        return name == 'stdin'
+    @property
+    def expired(self) -> bool:
+        interval = self._kernel.progress_interval
 
-    def read(self, _name: str) -> int:
-        """Returns the next character in the input.
-        If the input buffer is empty, it requests from the client.
+        return time.monotonic() - self._updated >= interval
 
-        """
-        if self._input is None:
-            # raw_input truncates the newline
-            self._input = iter(self._kernel.raw_input())
+    def update(self, fired: int):
+        environment = self._kernel.environment
+        self._updated = time.monotonic()
+        elapsed = self._updated - self._start
+        text = ("Fired %d rules (%d/sec), %d activations, %d facts"
+                % (fired, fired / elapsed if elapsed > 0 else 0,
+                   len(tuple(environment.activations())),
+                   self._kernel.fact_count()))
 
-        try:
-            return ord(next(self._input))
-        except StopIteration:
-            self._input = None
+        update = self._display_id is not None
+        if not update:
+            self._display_id = uuid.uuid4().hex
+        self._kernel.send_display(
+            {'text/plain': text}, self._display_id, update=update)
 
-            return ord('\n')
+    def close(self, fired: int):
+        """Publish the final progress if the display was created."""
+        if self._display_id is not None:
+            self.update(fired)
 
 
-class OutputRouter(clips.Router):
-    """CLIPS Router for capturing output requests."""
-    ROUTERS = {'stdout', 'stderr', 'stdwrn'}
+class OutputSpool:
+    """Forwards at most `limit` characters of output to the callback.
 
-    def __init__(self):
-        super().__init__('iclips-output-router', 40)
-        self._output = ''
+    Once the limit is exceeded, the whole output is spilled
+    into a temporary file and only its last `tail` characters
+    are kept in memory. These are forwarded to the callback
+    together with the file path on closing.
+
+    """
+    def __init__(self, callback: callable, limit: int, tail: int):
+        self.path = None
+        self.callback = callback
+        self.limit = limit
+        self.tail = tail
+        self._length = 0
+        self._head = []
+        self._tail = deque()
+        self._tail_length = 0
+        self._file = None
 
     @property
-    def output(self) -> str:
-        ret = self._output
-        self._output = ''
+    def truncated(self) -> bool:
+        return self._file is not None
+
+    def write(self, text: str):
+        if self._file is None:
+            room = self.limit - self._length
+
+            if len(text) <= room:
+                self._length += len(text)
+                self._head.append(text)
+                self.callback(text)
+
+                return
 
-        return ret
+            if room > 0:
+                self.callback(text[:room])
+            self._spill(text[:room])
+            self._length = self.limit
+            text = text[room:]
 
-    def query(self, name: str) -> bool:
-        return name in self.ROUTERS
+        self._file.write(text)
+        self._length += len(text)
+        if self.tail <= 0:
+            return
 
-    def write(self, _name: str, message: str):
-        """Appends the CLIPS message to the output."""
-        self._output += message
+        self._tail.append(text)
+        self._tail_length += len(text)
 
+        while self._tail and \
+                self._tail_length - len(self._tail[0]) >= self.tail:
+            self._tail_length -= len(self._tail.popleft())
 
-def even_parenthesis(code: str) -> bool:
-    counter = 0
-    string = False
+    def close(self):
+        """Close the spill file sending the truncated output tail."""
+        if self._file is None:
+            return
 
-    for character in code:
-        if character == '"':
-            string = False if string else True
-        elif not string and character == '(':
-            counter += 1
-        elif not string and character == ')':
-            counter -= 1
+        self._file.close()
 
-        if counter < 0:
-            return False
+        tail = ''.join(self._tail)[-self.tail:] if self.tail > 0 else ''
+        omitted = self._length - self.limit - len(tail)
 
-    return counter == 0
+        self.callback("\n[... %d characters omitted, full output in %s ...]\n"
+                      % (omitted, self.path) + tail)
+
+    def _spill(self, text: str):
+        self._head.append(text)
+        self._file = tempfile.NamedTemporaryFile(
+            mode='w', prefix='iclips-', suffix='.log', delete=False)
+        self._file.writelines(self._head)
+        self._head = None
+        self.path = self._file.name
+
+
+def magic_arguments(arguments: list, positional: int, *options) -> tuple:
+    """Split the Magic command arguments in positional ones and options.
+
+    Options are given in the form `name=value`.
+
+    """
+    values = [a for a in arguments if '=' not in a]
+    keywords = dict(a.split('=', 1) for a in arguments if '=' in a)
+
+    if len(values) != positional:
+        raise RuntimeError("Expected %d arguments, %d given"
+                           % (positional, len(values)))
+    unknown = set(keywords) - set(options)
+    if unknown:
+        raise RuntimeError("Unknown options: %s" % ', '.join(sorted(unknown)))
+
+    return values, keywords
 
 
 def global_environment(environment):
-    global CLIPS
+    """Expose the environment and the clips module to the Python code."""
+    global CLIPS, clips
+    import clips
+
     CLIPS = environment
 
 
+def clips_halt_functions(environment) -> tuple:
+    """Return two functions halting the CLIPS environment
+    and returning its memory in use, callable from other threads.
+
+    As the CLIPS console does on Ctrl-C, the halt flag is set directly:
+    CLIPS checks it within loops, function calls and between rule
+    firings, and clears it on the following command.
+
+    """
+    import ctypes
+    from clips import _clips
+
+    library = ctypes.CDLL(_clips.__file__)
+    library.SetHaltExecution.argtypes = (ctypes.c_void_p, ctypes.c_bool)
+    library.MemUsed.argtypes = (ctypes.c_void_p,)
+    library.MemUsed.restype = ctypes.c_longlong
+    pointer = int(_clips.ffi.cast('uintptr_t', environment._env))
+
+    return (lambda: library.SetHaltExecution(pointer, True),
+            lambda: library.MemUsed(pointer))
+
+
+@contextlib.contextmanager
+def interruption() -> threading.Event:
+    """Yield an Event set when an interruption (SIGINT) is received.
+
+    Within the context, SIGINT does not raise KeyboardInterrupt
+    as it would be lost if delivered within a CLIPS callback.
+
+    """
+    interrupted = threading.Event()
+
+    if threading.current_thread() is not threading.main_thread():
+        yield interrupted
+        return
+
+    handler = signal.signal(signal.SIGINT, lambda *_: interrupted.set())
+
+    try:
+        yield interrupted
+    finally:
+        signal.signal(signal.SIGINT, handler)
+
+
 @contextlib.contextmanager
 def capture_python_output() -> StringIO:
     """Yield a buffer capturing stdout and stderr.
@@ -319,12 +1546,20 @@ class CellMode(IntEnum):
 
 
 CLIPS = None
+DEFAULT_ENVIRONMENT = 'default'
+POOL_REFILL_DELAY = 1.0  # seconds after the request, likely idle by then
 FUNCNAME_REGEX = r'def (.*)\(.*\)'
-PARENTHESES_REGEX = r'([^()]*\((?:[^()]++|(?R))*+\))'
-MAGIC_COMMANDS = 'python', 'define-python-function'
+MAGIC_COMMANDS = ('python', 'define-python-function', 'load-data', 'budget',
+                  'profile', 'rete-stats', 'snapshot', 'env', 'parallel',
+                  'facts', 'instances', 'columnar', 'query', 'stdin',
+                  'trace')
 COMPLETION = KEYWORDS + BUILTINS + MAGIC_COMMANDS
+COLUMNAR_FORMATS = {'pandas': ('to_dataframe', 'from_dataframe'),
+                    'arrow': ('to_arrow', 'from_arrow')}
+BUDGET_LIMITS = {'time': float, 'firings': int, 'memory': parse_size}
 DEFCONSTRUCTS = ('deftemplate', 'deffunction', 'defmodule',
                  'defrule', 'defclass', 'defglobal', 'deffacts')
+WATCH_COMMANDS = ('watch', 'unwatch', 'list-watch-items')
 
 
 if __name__ == '__main__':
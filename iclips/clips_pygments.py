@@ -19,8 +19,8 @@
 
 import re
 
-from pygments.lexer import RegexLexer
-from pygments.token import Number, Punctuation, String
+from pygments.lexer import Lexer, RegexLexer
+from pygments.token import Number, Punctuation, String, Error
 from pygments.token import Text, Comment, Operator, Keyword, Name
 
 from iclips.common import KEYWORDS, BUILTINS
@@ -29,10 +29,12 @@ from iclips.common import KEYWORDS, BUILTINS
 __all__ = ['CLIPSLexer']
 
 
-class CLIPSLexer(RegexLexer):
+class RegexCLIPSLexer(RegexLexer):
     """A CLIPS lexer, parsing a stream and outputting the tokens
     needed to highlight CLIPS code.
 
+    Defines the tokens produced by the CLIPSLexer.
+
     """
     name = 'CLIPS'
     aliases = ['clips', 'clp']
@@ -58,3 +60,162 @@ class CLIPSLexer(RegexLexer):
                        (r'(\(|\))', Punctuation),
                        (r'(\[|\])', Punctuation),
                        (valid_name, Text))}
+
+
+class CLIPSLexer(Lexer):
+    """A CLIPS lexer, parsing a stream and outputting the tokens
+    needed to highlight CLIPS code.
+
+    Produces the same tokens as the RegexCLIPSLexer. Rather than trying
+    the keywords and builtins alternations at each symbol, the symbol
+    is matched once and classified via table lookups.
+
+    """
+    name = 'CLIPS'
+    aliases = ['clips', 'clp']
+    filenames = ['*.clp']
+    mimetypes = ['text/x-clips', 'application/x-clips']
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._symbols = {}
+
+    def get_tokens_unprocessed(self, text: str):
+        pos = 0
+        length = len(text)
+        match = TOKEN_REGEX.match
+
+        while pos < length:
+            token = match(text, pos)
+
+            if token is None:
+                yield pos, Error, text[pos]
+                pos += 1
+                continue
+
+            kind = token.lastgroup
+            if kind != 'symbol':
+                yield pos, TOKEN_TYPES[kind], token.group()
+                pos = token.end()
+                continue
+
+            symbol = token.group()
+            if symbol in IRREGULAR_KEYWORDS:
+                tokentype, value = self.irregular_token(text, pos, symbol)
+            else:
+                tokentype, value = self._symbols.get(symbol) or \
+                                   self.symbol_tokens(symbol)
+                if tokentype is Name.Builtin and (
+                        pos == 0 or text[pos - 1] != '('):
+                    tokentype, value = Text, symbol
+
+            yield pos, tokentype, value
+            pos += len(value)
+
+    def symbol_tokens(self, symbol: str) -> tuple:
+        """Classify the symbol.
+
+        As the regular expression alternations, the first keyword
+        or builtin in table order matching the start of the symbol
+        is taken. Builtins apply only if following an open parenthesis.
+
+        """
+        if len(self._symbols) >= SYMBOLS_CACHE_SIZE:
+            self._symbols.clear()
+
+        keyword = first_prefix(symbol, KEYWORD_ORDER, KEYWORD_LENGTH)
+        builtin = first_prefix(symbol, BUILTIN_ORDER, BUILTIN_LENGTH)
+        if keyword is not None:
+            classified = Keyword, keyword
+        elif builtin is not None:
+            classified = Name.Builtin, builtin
+        else:
+            classified = Text, symbol
+        self._symbols[symbol] = classified
+
+        return classified
+
+    def irregular_token(self, text: str, pos: int, symbol: str) -> tuple:
+        """Classify the symbol which might be the start of a keyword
+        containing other characters.
+
+        """
+        tokentype, value = self.symbol_tokens(symbol)
+        order = KEYWORD_ORDER.get(value, INFINITY) \
+            if tokentype is Keyword else INFINITY
+
+        for entry, entry_order in IRREGULAR_KEYWORDS[symbol]:
+            if entry_order < order and text.startswith(entry, pos):
+                return Keyword, entry
+
+        if tokentype is Name.Builtin and (pos == 0 or text[pos - 1] != '('):
+            return Text, symbol
+
+        return tokentype, value
+
+
+def first_prefix(symbol: str, order: dict, longest: int) -> str:
+    """Return the first entry in table order which is a prefix of symbol."""
+    found = None
+
+    for size in range(1, min(len(symbol), longest) + 1):
+        prefix = symbol[:size]
+        if prefix in order and (found is None or order[prefix] < order[found]):
+            found = prefix
+
+    return found
+
+
+def table_order(entries: tuple) -> dict:
+    order = {}
+    for index, entry in enumerate(entries):
+        order.setdefault(entry, index)
+
+    return order
+
+
+def irregular_keywords() -> dict:
+    """Keywords containing characters other than the symbol ones
+    by the symbol preceding those characters.
+
+    """
+    irregular = {}
+
+    for entry, order in table_order(KEYWORDS).items():
+        symbol = re.match(VALID_NAME, entry)
+        if symbol is not None and symbol.group() != entry:
+            irregular.setdefault(symbol.group(), []).append((entry, order))
+
+    return irregular
+
+
+VALID_NAME = RegexCLIPSLexer.valid_name
+# the rules of the RegexCLIPSLexer up to the keywords, then the symbols
+TOKEN_REGEX = re.compile('|'.join((
+    r'(?P<comment>;.*$)',
+    r'(?P<space>\s+)',
+    r'(?P<float>-?\d+\.\d+)',
+    r'(?P<integer>-?\d+)',
+    r'(?P<string>"(?:\\\\|\\"|[^"])*")',
+    r'(?P<constant>TRUE|FALSE|nil)',
+    r"(?P<operator>'|#|`|,@|,|\.)",
+    r'(?P<symbol>%s)' % VALID_NAME,
+    r'(?P<label>\?%s)' % VALID_NAME,
+    r'(?P<punctuation>[()\[\]])')), re.MULTILINE)
+TOKEN_TYPES = {'comment': Comment.Single,
+               'space': Text,
+               'float': Number.Float,
+               'integer': Number.Integer,
+               'string': String,
+               'constant': Name.Constant,
+               'operator': Operator,
+               'label': Name.Label,
+               'punctuation': Punctuation}
+KEYWORD_ORDER = {k: o for k, o in table_order(KEYWORDS).items()
+                 if re.fullmatch(VALID_NAME, k)}
+KEYWORD_LENGTH = max(len(k) for k in KEYWORD_ORDER)
+BUILTIN_ORDER = table_order(BUILTINS)
+BUILTIN_LENGTH = max(len(b) for b in BUILTIN_ORDER)
+IRREGULAR_KEYWORDS = irregular_keywords()
+SYMBOLS_CACHE_SIZE = 65536
+INFINITY = float('inf')
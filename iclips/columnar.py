@@ -0,0 +1,463 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar export and import of facts and instances.
+
+The facts of a deftemplate or the instances of a defclass are exported
+into pandas DataFrames or Arrow tables with one column per slot.
+Multislots become list columns. Arrow columns are typed according to
+the slot type constraints.
+
+Values keep their CLIPS type. Arrow columns of slots allowing a single
+type hold values of that type, any other slot holds CLIPS literals.
+The encoding is recorded within the field metadata.
+
+DataFrames are indexed by fact index or instance name.
+pandas and pyarrow are optional dependencies imported on use.
+
+"""
+
+import os
+import re
+import tempfile
+from typing import NamedTuple
+
+import clips
+
+from iclips.snapshot import literal, string
+
+
+class Slot(NamedTuple):
+    name: str
+    types: tuple
+    multifield: bool
+
+
+class Columns(NamedTuple):
+    """Slot values of the facts or instances of a construct by column."""
+    kind: str
+    name: str
+    slots: tuple
+    identifiers: list
+    values: dict
+
+
+def export_columns(environment: clips.Environment, name: str) -> Columns:
+    """Read the facts of the template or the instances of the class
+    with the given name in a single pass.
+
+    """
+    kind, construct = find_construct(environment, name)
+    slots = construct_slots(kind, construct)
+    identifiers = []
+    columns = [[] for _ in slots]
+
+    # slots are read by name, iterating over a fact lists its slot names
+    if kind == 'template':
+        for fact in construct.facts():
+            identifiers.append(fact.index)
+            for column, slot in zip(columns, slots):
+                column.append(fact[slot.name])
+    else:
+        for instance in construct.instances():
+            identifiers.append(str(instance.name))
+            for column, slot in zip(columns, slots):
+                column.append(instance[slot.name])
+
+    return Columns(kind, construct.name, slots, identifiers,
+                   {s.name: c for s, c in zip(slots, columns)})
+
+
+def import_columns(environment: clips.Environment, name: str,
+                   values: dict, identifiers: list = None) -> int:
+    """Assert facts or make instances from the given columns.
+
+    Columns are mapped to slots by name, missing values (None or NaN)
+    leave the slot to its default. Instances are named after
+    the identifiers, if given. Returns the amount of elements created.
+
+    Facts are loaded as text, parsing them within CLIPS is faster
+    than building them one slot at a time. The amount of facts created
+    excludes the duplicates of existing facts. Raises ValueError
+    if CLIPS rejects a fact, the facts preceding it stay asserted.
+
+    """
+    kind, construct = find_construct(environment, name)
+    slots = {s.name: s for s in construct_slots(kind, construct)}
+    unknown = set(values) - set(slots)
+    if unknown:
+        raise LookupError("Unknown slots: %s" % ', '.join(sorted(unknown)))
+
+    if kind == 'template':
+        columns = [slot_texts(slots[n], c) for n, c in values.items()]
+        facts = ['(%s %s)' % (construct.name, ' '.join(filter(None, fields)))
+                 for fields in zip(*columns)]
+        count = template_facts(environment, construct.name)
+
+        try:
+            load_facts(environment, facts)
+        except clips.CLIPSError as error:
+            raise ValueError("%d of %d rows imported%s" % (
+                template_facts(environment, construct.name) - count,
+                len(facts), ': %s' % error if str(error) else ''))
+
+        return template_facts(environment, construct.name) - count
+
+    converters = [(n, column_converter(slots[n])) for n in values]
+    rows = [{slot: convert(value)
+             for (slot, convert), value in zip(converters, row)
+             if not missing(value)}
+            for row in zip(*values.values())]
+
+    for index, fields in enumerate(rows):
+        construct.make_instance(
+            identifiers[index] if identifiers is not None else None,
+            **fields)
+
+    return len(rows)
+
+
+def to_dataframe(environment: clips.Environment, name: str):
+    """Export the facts or instances into a pandas DataFrame."""
+    import pandas
+
+    columns = export_columns(environment, name)
+    index = pandas.Index(columns.identifiers, name=INDEX_NAMES[columns.kind])
+    # pandas would turn the integers of mixed numeric columns into floats
+    values = {s.name: pandas.Series(
+        [list(v) for v in columns.values[s.name]] if s.multifield
+        else columns.values[s.name], index=index,
+        dtype=None if slot_encoding(s) != LITERAL else object)
+              for s in columns.slots}
+
+    return pandas.DataFrame(values, index=index,
+                            columns=[s.name for s in columns.slots])
+
+
+def from_dataframe(environment: clips.Environment, name: str,
+                   frame) -> int:
+    """Import the DataFrame rows as facts or instances.
+
+    If the DataFrame index is named `instance`,
+    it provides the instance names.
+
+    """
+    identifiers = frame.index.tolist() \
+        if frame.index.name == INDEX_NAMES['class'] else None
+
+    return import_columns(environment, name,
+                          {c: frame[c].tolist() for c in frame.columns},
+                          identifiers)
+
+
+def to_arrow(environment: clips.Environment, name: str):
+    """Export the facts or instances into an Arrow table.
+
+    The table metadata holds the construct name, the field metadata
+    the CLIPS type of the values or LITERAL for CLIPS literals.
+
+    """
+    import pyarrow
+
+    columns = export_columns(environment, name)
+    schema = pyarrow.schema(
+        [pyarrow.field(s.name, arrow_type(s),
+                       metadata={ENCODING_KEY: slot_encoding(s)})
+         for s in columns.slots],
+        metadata={'clips.%s' % columns.kind: columns.name})
+    arrays = [arrow_array(s, columns.values[s.name], field.type)
+              for s, field in zip(columns.slots, schema)]
+
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+def from_arrow(environment: clips.Environment, name: str, table) -> int:
+    """Import the Arrow table rows as facts or instances.
+
+    Columns are decoded according to their field metadata, if any.
+    Strings stored into symbol only slots become symbols on import,
+    such columns are not decoded.
+
+    """
+    kind, construct = find_construct(environment, name)
+    slots = {s.name: s for s in construct_slots(kind, construct)}
+    values = {}
+
+    for field in table.schema:
+        metadata = field.metadata or {}
+        encoding = metadata.get(ENCODING_KEY, b'').decode()
+        slot = slots.get(field.name)
+        if encoding == 'SYMBOL' and slot and slot_encoding(slot) == 'SYMBOL':
+            encoding = 'STRING'
+        decode = value_decoder(encoding)
+        column = table.column(field.name).to_pylist()
+        if decode is None:
+            values[field.name] = column
+        elif pyarrow_list(field.type):
+            values[field.name] = [v if v is None else [decode(e) for e in v]
+                                  for v in column]
+        else:
+            values[field.name] = [v if v is None else decode(v)
+                                  for v in column]
+
+    return import_columns(environment, name, values)
+
+
+def find_construct(environment: clips.Environment, name: str) -> tuple:
+    """Return the template or the class with the given name."""
+    try:
+        return 'template', environment.find_template(name)
+    except LookupError:
+        pass
+
+    try:
+        return 'class', environment.find_class(name)
+    except LookupError:
+        raise LookupError("No template or class named %s" % name)
+
+
+def construct_slots(kind: str, construct) -> tuple:
+    if kind == 'template':
+        if construct.implied:
+            raise ValueError("Implied template %s has no slots"
+                             % construct.name)
+
+        return tuple(Slot(s.name, s.types, s.multifield)
+                     for s in construct.slots)
+
+    return tuple(Slot(s.name, s.types, 'MLT' in s.facets)
+                 for s in construct.slots())
+
+
+def slot_encoding(slot: Slot) -> str:
+    """Return how the slot values are stored within Arrow columns.
+
+    Slots allowing a single type store values of that type,
+    any other slot stores CLIPS literals to keep the value types.
+
+    """
+    if len(slot.types) == 1 and slot.types[0] in ARROW_TYPES:
+        return slot.types[0]
+
+    return LITERAL
+
+
+def arrow_type(slot: Slot):
+    """Return the Arrow type of the slot values."""
+    import pyarrow
+
+    value_type = getattr(pyarrow, ARROW_TYPES[slot_encoding(slot)])()
+
+    return pyarrow.list_(value_type) if slot.multifield else value_type
+
+
+def arrow_array(slot: Slot, values: list, data_type):
+    import pyarrow
+
+    encode = value_encoder(slot)
+    if slot.multifield:
+        values = [[encode(v) for v in value] for value in values]
+    else:
+        values = [encode(v) for v in values]
+
+    return pyarrow.array(values, type=data_type)
+
+
+def value_encoder(slot: Slot) -> callable:
+    encoding = slot_encoding(slot)
+
+    if encoding == LITERAL:
+        def encode(value):
+            try:
+                return literal(value)
+            except TypeError as error:
+                raise ValueError("Slot %s: %s" % (slot.name, error))
+
+        return encode
+    if encoding in ('INTEGER', 'FLOAT'):
+        return lambda value: value
+
+    return str
+
+
+def value_decoder(encoding: str) -> callable:
+    """Return the function decoding the Arrow values, None if they are
+    already of their CLIPS type."""
+    if encoding == LITERAL:
+        return parse_literal
+    if encoding == 'SYMBOL':
+        return clips.Symbol
+    if encoding == 'INSTANCE-NAME':
+        return clips.InstanceName
+
+    return None
+
+
+def parse_literal(text: str):
+    """Return the value of the CLIPS literal."""
+    if text.startswith('"'):
+        return STRING_ESCAPE.sub(r'\1', text[1:-1])
+    if text.startswith('[') and text.endswith(']'):
+        return clips.InstanceName(text[1:-1])
+    if NUMBER.fullmatch(text):
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    return clips.Symbol(text)
+
+
+def pyarrow_list(data_type) -> bool:
+    import pyarrow
+
+    return pyarrow.types.is_list(data_type)
+
+
+def column_converter(slot: Slot) -> callable:
+    """Return a function converting column values into slot values.
+
+    Strings become symbols if the slot does not allow strings,
+    integral floats become integers if the slot does not allow floats.
+
+    """
+    types = set(slot.types)
+    symbol = 'SYMBOL' in types and 'STRING' not in types
+    integer = 'INTEGER' in types and 'FLOAT' not in types
+
+    def convert(value):
+        if type(value) is str:  # CLIPS values are str subclasses
+            return clips.Symbol(value) if symbol else value
+        if integer and isinstance(value, float) and value.is_integer():
+            return int(value)
+
+        return value
+
+    if slot.multifield:
+        return lambda value: [convert(v) for v in value]
+
+    return convert
+
+
+def load_facts(environment: clips.Environment, facts: iter):
+    """Load the facts through a file.
+
+    Strings are read by CLIPS querying every router for each character.
+    Unlike Environment.load_facts, the (load-facts) command raises
+    CLIPSError if a fact is rejected.
+
+    """
+    with tempfile.TemporaryDirectory(prefix='iclips-') as directory:
+        path = os.path.join(directory, 'facts.clp')
+        with open(path, 'w') as facts_file:
+            for fact in facts:
+                facts_file.write(fact + '\n')
+
+        environment.eval('(load-facts %s)' % string(path))
+
+
+def template_facts(environment: clips.Environment, template: str) -> int:
+    return environment.eval(
+        '(length$ (find-all-facts ((?f %s)) TRUE))' % template)
+
+
+def slot_texts(slot: Slot, column: list) -> list:
+    """Return the column values in the syntax of the CLIPS (load-facts)
+    command, empty strings for the missing ones.
+
+    """
+    encode = text_encoder(slot)
+    text = '(%s %%s)' % slot.name
+
+    # v != v is true only for NaN
+    if slot.multifield:
+        return ['' if v is None or v != v else
+                text % ' '.join([encode(e) for e in v])
+                for v in column]
+
+    return ['' if v is None or v != v else text % encode(v) for v in column]
+
+
+def text_encoder(slot: Slot) -> callable:
+    """Return a function converting column values into CLIPS literals.
+
+    Values already of the single type allowed by the slot
+    skip the generic conversion.
+
+    """
+    convert = column_converter(slot)
+    if slot.multifield:
+        convert = column_converter(slot._replace(multifield=False))
+
+    def generic(value):
+        value = convert(value)
+        if isinstance(value, clips.Symbol):
+            check_symbol(slot, value)
+
+        return literal(value)
+
+    checked = set()  # symbol columns repeat their values
+
+    def symbol(value):
+        if type(value) not in SYMBOL_TYPES:
+            return generic(value)
+        if value not in checked:
+            checked.add(check_symbol(slot, value))
+
+        return value
+
+    encoding = slot_encoding(slot)
+    if encoding == 'SYMBOL':
+        return symbol
+    if encoding == 'STRING':
+        return lambda v: string(v) if type(v) is str else generic(v)
+    if encoding == 'INTEGER':
+        return lambda v: repr(v) if type(v) is int else generic(v)
+    if encoding == 'FLOAT':
+        return lambda v: repr(v) if type(v) is float else generic(v)
+
+    return generic
+
+
+def check_symbol(slot: Slot, value: str) -> str:
+    """Return the symbol or the instance name if it can be written
+    as such within a fact, raise ValueError otherwise.
+
+    """
+    instance = isinstance(value, clips.InstanceName)
+
+    if (not SYMBOL.fullmatch(value) or NUMBER.fullmatch(value) or
+            (instance and ']' in value)):
+        raise ValueError("Slot %s: %r is not a valid CLIPS %s" % (
+            slot.name, value, 'instance name' if instance else 'symbol'))
+
+    return value
+
+
+def missing(value) -> bool:
+    """None and NaN values are missing."""
+    return value is None or (isinstance(value, float) and value != value)
+
+
+INDEX_NAMES = {'template': 'fact', 'class': 'instance'}
+LITERAL = 'LITERAL'
+ENCODING_KEY = b'clips.type'
+ARROW_TYPES = {'INTEGER': 'int64', 'FLOAT': 'float64', 'STRING': 'string',
+               'SYMBOL': 'string', 'INSTANCE-NAME': 'string',
+               LITERAL: 'string'}
+NUMBER = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+SYMBOL = re.compile(r'(?![?[]|[$][?])[^\s()";&|~<]+')
+SYMBOL_TYPES = (str, clips.Symbol)  # strings become symbols in such slots
+STRING_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
@@ -0,0 +1,80 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Completion candidates index."""
+
+from bisect import bisect_left
+
+
+class CompletionIndex:
+    """Sorted array of the symbols known within a CLIPS environment.
+
+    The array is built lazily on the first lookup
+    and kept until the index is invalidated.
+
+    """
+    def __init__(self, environment, static: tuple = ()):
+        self.environment = environment
+        self.static = static
+        self._symbols = None
+
+    @property
+    def symbols(self) -> list:
+        if self._symbols is None:
+            symbols = set(self.static)
+            symbols.update(environment_symbols(self.environment))
+            self._symbols = sorted(symbols)
+
+        return self._symbols
+
+    def invalidate(self):
+        """Drop the index, it will be rebuilt on the next lookup."""
+        self._symbols = None
+
+    def lookup(self, prefix: str) -> list:
+        """Return the symbols starting with the given prefix."""
+        symbols = self.symbols
+        start = bisect_left(symbols, prefix)
+        end = bisect_left(symbols, prefix + MAX_CHARACTER, lo=start)
+
+        return symbols[start:end]
+
+
+def environment_symbols(environment) -> iter:
+    """Yield the names of the constructs defined within the environment."""
+    for defclass in environment.classes():
+        yield defclass.name
+        yield from (s.name for s in defclass.slots())
+
+    for template in environment.templates():
+        yield template.name
+        yield from (s.name for s in template.slots)
+
+    yield from (g.name for g in environment.generics())
+    yield from (f.name for f in environment.functions())
+    yield from (g.name for g in environment.globals())
+
+
+def modifies_constructs(function: str) -> bool:
+    """True if the given CLIPS function might define or remove constructs."""
+    return function in CONSTRUCT_COMMANDS or function.startswith('undef')
+
+
+MAX_CHARACTER = chr(0x10FFFF)
+CONSTRUCT_COMMANDS = {'deftemplate', 'deffunction', 'defmodule', 'defrule',
+                      'defclass', 'defglobal', 'deffacts', 'defgeneric',
+                      'defmethod', 'definstances', 'defmessage-handler',
+                      'build', 'eval', 'clear', 'load', 'load*',
+                      'bload', 'batch', 'batch*'}
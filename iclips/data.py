@@ -0,0 +1,202 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Bulk loading of data files into CLIPS."""
+
+import csv
+import json
+import time
+
+import clips
+
+
+class LoadReport:
+    """Outcome of a data file loading."""
+    MAX_ERRORS = 10
+
+    def __init__(self):
+        self.loaded = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def __str__(self):
+        rate = self.loaded / self.elapsed if self.elapsed > 0 else 0
+        text = "Loaded %d facts in %.3f seconds (%d rows/sec)\n" % (
+            self.loaded, self.elapsed, rate)
+
+        if self.errors:
+            text += "Skipped %d rows:\n" % len(self.errors)
+            text += ''.join("  row %d: %s\n" % error
+                            for error in self.errors[:self.MAX_ERRORS])
+            if len(self.errors) > self.MAX_ERRORS:
+                text += "  ...\n"
+
+        return text
+
+
+def load_data(template: clips.Template, path: str) -> LoadReport:
+    """Assert the rows of a CSV, JSON or JSON Lines file as template facts.
+
+    Row fields are mapped to the template slots by name
+    and converted according to the slot types.
+    Rows which cannot be read or asserted are skipped.
+
+    """
+    report = LoadReport()
+    converters = {s.name: slot_converter(s) for s in template.slots}
+    start = time.perf_counter()
+
+    # undecodable bytes fail the row when asserted, not the whole file
+    with open(path, newline='', errors='surrogateescape') as data_file:
+        for number, row in read_rows(data_file, path):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                template.assert_fact(**row_slots(row, converters))
+            except (TypeError, ValueError, LookupError,
+                    csv.Error, clips.CLIPSError) as error:
+                report.errors.append((number, error))
+            else:
+                report.loaded += 1
+
+    report.elapsed = time.perf_counter() - start
+
+    return report
+
+
+def read_rows(data_file, path: str) -> iter:
+    """Iterate over the numbered rows of a CSV, JSON or JSON Lines file
+    as dictionaries.
+
+    JSON files contain an array of rows. Rows are numbered by line,
+    by position within JSON arrays. Rows which cannot be parsed
+    are given as the parsing error.
+
+    """
+    if path.endswith('.csv'):
+        return csv_rows(data_file)
+    if path.endswith(('.jsonl', '.ndjson')):
+        return json_lines_rows(data_file)
+    if path.endswith('.json'):
+        return json_rows(data_file)
+
+    raise ValueError(
+        "Unsupported file format, expected CSV, JSON or JSON Lines")
+
+
+def csv_rows(data_file) -> iter:
+    reader = csv.DictReader(data_file)
+    number = 0
+
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            row = error
+
+        yield number, row
+
+
+def json_lines_rows(data_file) -> iter:
+    for number, line in enumerate(data_file, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            row = error
+
+        yield number, row
+
+
+def json_rows(data_file) -> iter:
+    try:
+        rows = json.load(data_file)
+    except ValueError as error:
+        raise ValueError("Invalid JSON file: %s" % error)
+    if not isinstance(rows, list):
+        raise ValueError("JSON file does not contain an array of rows")
+
+    return enumerate(rows, start=1)
+
+
+def row_slots(row: dict, converters: dict) -> dict:
+    """Convert a data row into the slot values of a fact."""
+    if not isinstance(row, dict):
+        raise TypeError("row is not an object")
+
+    slots = {}
+
+    for name, value in row.items():
+        if value == '' or value is None:
+            continue
+
+        try:
+            slots[name] = converters[name](value)
+        except KeyError:
+            raise LookupError("unknown slot %s" % name)
+
+    return slots
+
+
+def slot_converter(slot: clips.facts.TemplateSlot) -> callable:
+    """Return a function converting data values according to the slot types.
+
+    Multifield slots accept lists or whitespace separated strings.
+
+    """
+    convert = value_converter(slot.types)
+
+    if slot.multifield:
+        def convert_multifield(value):
+            values = value.split() if isinstance(value, str) else value
+
+            return [convert(v) for v in values]
+
+        return convert_multifield
+
+    return convert
+
+
+def value_converter(types: tuple) -> callable:
+    """Return a function converting strings into the allowed types.
+
+    Numbers are parsed if allowed, strings become symbols
+    only if the slot does not allow strings.
+
+    """
+    numbers = [t for t in (int, float) if NUMBER_TYPES[t] in types]
+    symbol = 'SYMBOL' in types and 'STRING' not in types
+
+    def convert(value):
+        if not isinstance(value, str):
+            return value
+
+        for number in numbers:
+            try:
+                return number(value)
+            except ValueError:
+                pass
+
+        return clips.Symbol(value) if symbol else value
+
+    return convert
+
+
+NUMBER_TYPES = {int: 'INTEGER', float: 'FLOAT'}
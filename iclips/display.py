@@ -0,0 +1,60 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Rich display of tabular data."""
+
+from html import escape
+
+
+def table(headers: tuple, rows: list, title: str = '') -> dict:
+    """Render the rows as plain text and HTML tables.
+
+    Returns the display data as a mimetype dictionary.
+
+    """
+    rows = [tuple(format_cell(c) for c in row) for row in rows]
+
+    return {'text/plain': text_table(headers, rows, title),
+            'text/html': html_table(headers, rows, title)}
+
+
+def text_table(headers: tuple, rows: list, title: str = '') -> str:
+    widths = [max(len(r[i]) for r in [headers] + rows)
+              for i in range(len(headers))]
+    lines = [title] if title else []
+
+    for row in [headers, tuple('-' * w for w in widths)] + rows:
+        lines.append('  '.join(c.ljust(w) if i == 0 else c.rjust(w)
+                               for i, (c, w) in enumerate(zip(row, widths))))
+
+    return '\n'.join(lines) + '\n'
+
+
+def html_table(headers: tuple, rows: list, title: str = '') -> str:
+    caption = '<caption>%s</caption>' % escape(title) if title else ''
+    header = ''.join('<th>%s</th>' % escape(h) for h in headers)
+    body = ''.join('<tr>%s</tr>' % ''.join('<td>%s</td>' % escape(c)
+                                           for c in row)
+                   for row in rows)
+
+    return ('<table>%s<thead><tr>%s</tr></thead><tbody>%s</tbody></table>'
+            % (caption, header, body))
+
+
+def format_cell(value) -> str:
+    if isinstance(value, float):
+        return '%.6f' % value
+
+    return str(value)
@@ -0,0 +1,313 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Fork server launching pre-loaded CLIPS kernels.
+
+The server imports the kernel modules and loads the shared rulebase
+once, then forks a kernel process for each launch request. The kernels
+share the memory of the loaded rulebase copy-on-write.
+
+    $ python3 -m iclips.forkserver serve --load rulebase.clp
+
+The kernel specification launches the kernels through the server.
+
+    "argv": ["python3", "-m", "iclips.forkserver", "launch",
+             "-f", "{connection_file}"]
+
+The launcher stays in place of the kernel process: it forwards the
+interruption and termination signals to the forked kernel and exits
+with its status. If the server is not running, the kernel is started
+within the launcher process.
+
+"""
+
+import gc
+import os
+import sys
+import json
+import select
+import signal
+import socket
+import argparse
+import contextlib
+
+from jupyter_core.paths import jupyter_runtime_dir
+
+
+class ForkServer:
+    """Forks a kernel process for each request received on the socket.
+
+    The connection with the launcher is kept open until the kernel exits.
+    Its exit status is then sent to the launcher. If the launcher
+    disconnects, the kernel is killed.
+
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.kernels = {}  # pid: launcher connection
+        self._listener = None
+        self._wakeup = None
+
+    def serve_forever(self):
+        self._wakeup, wakeup = os.pipe()
+        os.set_blocking(wakeup, False)
+        signal.set_wakeup_fd(wakeup)
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        # the socket is created accessible to the owner only
+        umask = os.umask(0o177)
+        try:
+            self._listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        self._listener.listen()
+
+        try:
+            while True:
+                self.serve()
+        finally:
+            self._listener.close()
+            os.unlink(self.path)
+
+    def serve(self):
+        connections = {c: p for p, c in self.kernels.items()}
+        readable, _, _ = select.select(
+            [self._listener, self._wakeup] + list(connections), [], [], 1)
+
+        for ready in readable:
+            if ready is self._listener:
+                self.accept()
+            elif ready == self._wakeup:
+                os.read(self._wakeup, 512)
+            elif not ready.recv(1):  # launcher disconnected
+                with contextlib.suppress(ProcessLookupError):
+                    os.kill(connections[ready], signal.SIGKILL)
+
+        self.reap()
+
+    def accept(self):
+        connection, _ = self._listener.accept()
+
+        try:
+            request, fds = receive_request(connection)
+        except (OSError, ValueError):
+            connection.close()
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            self._listener.close()
+            for kernel_connection in self.kernels.values():
+                kernel_connection.close()
+
+            os._exit(kernel_process(request, fds))
+
+        for fd in fds:
+            os.close(fd)
+        self.kernels[pid] = connection
+        send_message(connection, {'pid': pid})
+
+    def reap(self):
+        """Send the exit status of the terminated kernels."""
+        for pid in list(self.kernels):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if not done:
+                continue
+
+            connection = self.kernels.pop(pid)
+            with contextlib.suppress(OSError):
+                send_message(connection,
+                             {'status': os.waitstatus_to_exitcode(status)})
+            connection.close()
+
+
+def kernel_process(request: dict, fds: list) -> int:
+    """Run the kernel within the forked process returning its status."""
+    try:
+        for fd, standard in zip(fds, (0, 1, 2)):
+            os.dup2(fd, standard)
+            os.close(fd)
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGCHLD, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['environment'])
+
+        launch_kernel(request['connection_file'], ENVIRONMENT)
+    except SystemExit as error:
+        return error.code if isinstance(error.code, int) else 1
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    return 0
+
+
+def serve(arguments: argparse.Namespace) -> int:
+    """Load the shared rulebase and serve the launch requests."""
+    global ENVIRONMENT
+
+    # imported before forking to be shared by the kernels
+    import clips
+    import ipykernel.kernelapp  # pylint: disable=unused-import
+    import iclips.clips_kernel  # pylint: disable=unused-import
+    from iclips.snapshot import load_snapshot
+
+    ENVIRONMENT = clips.Environment()
+
+    try:
+        if arguments.snapshot:
+            load_snapshot(ENVIRONMENT, arguments.snapshot)
+        for path in arguments.load:
+            ENVIRONMENT.load(path)
+        if arguments.reset:
+            ENVIRONMENT.reset()
+    except (OSError, clips.CLIPSError) as error:
+        print("Unable to load the rulebase: %s" % error, file=sys.stderr)
+        return 1
+
+    # keep the loaded objects out of the collector to preserve shared pages
+    gc.freeze()
+
+    server = ForkServer(arguments.socket)
+    print("iCLIPS fork server listening on %s" % arguments.socket)
+    sys.stdout.flush()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def launch(arguments: argparse.Namespace) -> int:
+    """Launch a kernel via the fork server and wait for its termination."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        connection.connect(arguments.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        launch_kernel(arguments.connection_file)
+
+        return 0
+
+    request = {'connection_file': os.path.abspath(arguments.connection_file),
+               'cwd': os.getcwd(),
+               'environment': dict(os.environ)}
+    socket.send_fds(connection, [encode(request)], [0, 1, 2])
+
+    reader = connection.makefile('rb')
+    pid = decode(reader.readline())['pid']
+
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, lambda signum, _: os.kill(pid, signum))
+
+    try:
+        return decode(reader.readline())['status']
+    except ValueError:  # server terminated
+        return 1
+
+
+def launch_kernel(connection_file: str, environment=None):
+    """Run the kernel within the current process.
+
+    If an environment is given, the kernel adopts it.
+
+    """
+    from ipykernel.kernelapp import IPKernelApp
+    from iclips.clips_kernel import CLIPSKernel
+
+    class PreloadedKernel(CLIPSKernel):
+        def default_environment(self):
+            return environment
+
+    IPKernelApp.launch_instance(
+        kernel_class=PreloadedKernel if environment is not None
+        else CLIPSKernel, argv=['-f', connection_file])
+
+
+def receive_request(connection: socket.socket) -> tuple:
+    message, fds, _, _ = socket.recv_fds(connection, 65536, 3)
+
+    while not message.endswith(b'\n'):
+        data = connection.recv(65536)
+        if not data:
+            raise ValueError("Incomplete request")
+        message += data
+
+    return decode(message), fds
+
+
+def send_message(connection: socket.socket, message: dict):
+    connection.sendall(encode(message))
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message).encode() + b'\n'
+
+
+def decode(line: bytes) -> dict:
+    return json.loads(line.decode())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m iclips.forkserver',
+                                     description="iCLIPS kernel fork server")
+    parser.add_argument('-s', '--socket', default=SOCKET_PATH,
+                        help="server socket path (default %s)" % SOCKET_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="run the fork server")
+    serve_parser.add_argument('-l', '--load', action='append', default=[],
+                              help="CLIPS constructs file shared by kernels")
+    serve_parser.add_argument('--snapshot',
+                              help="snapshot directory shared by kernels")
+    serve_parser.add_argument('--reset', action='store_true',
+                              help="reset the environment once loaded")
+    serve_parser.set_defaults(function=serve)
+
+    launch_parser = commands.add_parser('launch', help="launch a kernel")
+    launch_parser.add_argument('-f', dest='connection_file', required=True,
+                               help="kernel connection file")
+    launch_parser.set_defaults(function=launch)
+
+    arguments = parser.parse_args()
+
+    return arguments.function(arguments)
+
+
+ENVIRONMENT = None
+SOCKET_PATH = os.path.join(jupyter_runtime_dir(), 'iclips-forkserver.sock')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
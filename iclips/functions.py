@@ -0,0 +1,207 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Memoization and batching of the Python functions called by CLIPS."""
+
+import time
+import functools
+from typing import NamedTuple
+from collections import OrderedDict
+
+from iclips.display import table
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ResultCache:
+    """Least recently used results of a function by its arguments.
+
+    Results older than `ttl` seconds, if given, are computed again.
+    Only calls with numbers, symbols, strings and multifields
+    as arguments are cached: facts and instances can change.
+
+    """
+    def __init__(self, size: int = 128, ttl: float = None):
+        if size < 1:
+            raise ValueError("Cache size must be positive")
+
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: (result, time)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, arguments: tuple):
+        """Return the cached result or MISSING."""
+        key = cache_key(arguments)
+        entry = self._entries.get(key) if key is not None else None
+
+        if entry is None or (self.ttl is not None and
+                             time.monotonic() - entry[1] >= self.ttl):
+            self.misses += 1
+            return MISSING
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return entry[0]
+
+    def store(self, arguments: tuple, result):
+        key = cache_key(arguments)
+        if key is None:
+            return
+
+        self._entries[key] = result, time.monotonic()
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.size, len(self))
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class MemoizedFunction:
+    """Wraps a Python function caching its results."""
+    def __init__(self, function: callable, cache: ResultCache):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.cache = cache
+
+    def __call__(self, *arguments):
+        result = self.cache.lookup(arguments)
+
+        if result is MISSING:
+            result = self.function(*arguments)
+            self.cache.store(arguments, result)
+
+        return result
+
+    def cache_info(self) -> CacheInfo:
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+
+class BatchedFunction:
+    """Wraps a Python function taking a list of argument tuples
+    and returning the list of their results.
+
+    Within CLIPS, the function takes the arguments of several calls
+    in sequence, `arity` arguments per call, and returns a multifield
+    with a result per call. Multifield arguments are expanded.
+    If a cache is given, only the calls missing from it are passed
+    to the Python function.
+
+    """
+    def __init__(self, function: callable, arity: int,
+                 cache: ResultCache = None):
+        if arity < 1:
+            raise ValueError("Batch arity must be positive")
+
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.arity = arity
+        self.cache = cache
+
+    def __call__(self, *arguments) -> tuple:
+        values = [v for a in arguments
+                  for v in (a if isinstance(a, tuple) else (a, ))]
+        if len(values) % self.arity:
+            raise ValueError("Expected a multiple of %d arguments, %d given"
+                             % (self.arity, len(values)))
+
+        calls = [tuple(values[i:i + self.arity])
+                 for i in range(0, len(values), self.arity)]
+        if self.cache is None:
+            return tuple(self.batch(calls))
+
+        results = [self.cache.lookup(c) for c in calls]
+        missing = [i for i, r in enumerate(results) if r is MISSING]
+        if missing:
+            for index, result in zip(missing, self.batch(
+                    [calls[i] for i in missing])):
+                results[index] = result
+                self.cache.store(calls[index], result)
+
+        return tuple(results)
+
+    def batch(self, calls: list) -> list:
+        results = list(self.function(calls))
+        if len(results) != len(calls):
+            raise ValueError("Expected %d results, %d returned"
+                             % (len(calls), len(results)))
+
+        return results
+
+    def cache_info(self) -> CacheInfo:
+        return self.cache.info() if self.cache is not None else None
+
+    def cache_clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
+def cache_key(arguments: tuple) -> tuple:
+    """Return the cache key of the arguments, None if not cacheable.
+
+    Values are paired with their type as symbols equal strings
+    and integers equal floats in Python.
+
+    """
+    key = []
+
+    for argument in arguments:
+        if isinstance(argument, tuple):
+            argument = cache_key(argument)
+            if argument is None:
+                return None
+        elif not isinstance(argument, (int, float, str)):
+            return None
+        key.append((type(argument), argument))
+
+    return tuple(key)
+
+
+def cache_table(functions: dict) -> dict:
+    """Render the cache statistics of the given functions as display data."""
+    rows = []
+
+    for name, function in sorted(functions.items()):
+        cache = function.cache
+        calls = cache.hits + cache.misses
+        rows.append((name, len(cache), cache.size,
+                     cache.ttl if cache.ttl is not None else '',
+                     cache.hits, cache.misses,
+                     cache.hits / calls if calls else 0.0))
+
+    return table(('Function', 'Entries', 'Size', 'TTL', 'Hits', 'Misses',
+                  'Hit ratio'), rows, title='Python function caches')
+
+
+MISSING = object()
@@ -0,0 +1,206 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Kernel metrics.
+
+The metrics of each execution are attached to the execute reply
+metadata. The latencies of the kernel requests are kept in histograms
+which can be exposed on localhost in the Prometheus text format.
+
+"""
+
+import bisect
+import heapq
+import threading
+from typing import NamedTuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CommandMetrics(NamedTuple):
+    index: int
+    command: str
+    time: float
+    firings: int
+    memory: int
+
+
+class Histogram:
+    """Cumulative histogram of the observed values."""
+    def __init__(self, buckets: tuple = None):
+        self.buckets = tuple(buckets or LATENCY_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self) -> tuple:
+        """Return the (bound, cumulative count) pairs, the sum and the count
+        of the observed values.
+
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        cumulative = 0
+        buckets = []
+        for bound, bucket in zip(self.buckets + (INFINITY,), counts):
+            cumulative += bucket
+            buckets.append((bound, cumulative))
+
+        return buckets, total, count
+
+
+class KernelMetrics:
+    """Latencies of the kernel requests and state of the CLIPS environment
+    after the last execution.
+
+    """
+    def __init__(self):
+        self.latency = {r: Histogram() for r in REQUESTS}
+        self.executions = {'ok': 0, 'error': 0}
+        self.firings = 0
+        self.facts = 0
+        self.memory = 0
+
+    def observe(self, request: str, seconds: float):
+        self.latency[request].observe(seconds)
+
+    def record(self, status: str, firings: int, metrics: dict = None):
+        """Account an execution, its facts and memory if measured."""
+        self.executions[status] = self.executions.get(status, 0) + 1
+        self.firings += firings
+        if metrics is not None:
+            self.facts = metrics['facts']['after']
+            self.memory = metrics['memory']['after']
+
+    def exposition(self) -> str:
+        """Render the metrics in the Prometheus text format."""
+        lines = ['# HELP iclips_request_duration_seconds '
+                 'Latency of the kernel requests.',
+                 '# TYPE iclips_request_duration_seconds histogram']
+
+        for request, histogram in self.latency.items():
+            buckets, total, count = histogram.samples()
+            for bound, cumulative in buckets:
+                lines.append('iclips_request_duration_seconds_bucket'
+                             '{request="%s",le="%s"} %d' % (
+                                 request, prometheus_float(bound), cumulative))
+            lines.append('iclips_request_duration_seconds_sum'
+                         '{request="%s"} %r' % (request, total))
+            lines.append('iclips_request_duration_seconds_count'
+                         '{request="%s"} %d' % (request, count))
+
+        lines.extend(('# HELP iclips_executions_total '
+                      'Executed cells by reply status.',
+                      '# TYPE iclips_executions_total counter'))
+        lines.extend('iclips_executions_total{status="%s"} %d' % (s, c)
+                     for s, c in sorted(self.executions.items()))
+        for name, kind, text, value in (
+                ('rule_firings_total', 'counter',
+                 'Rules fired within the executed cells.', self.firings),
+                ('facts', 'gauge',
+                 'Facts after the last execution.', self.facts),
+                ('memory_bytes', 'gauge',
+                 'Memory used by CLIPS after the last execution.',
+                 self.memory)):
+            lines.extend(('# HELP iclips_%s %s' % (name, text),
+                          '# TYPE iclips_%s %s' % (name, kind),
+                          'iclips_%s %d' % (name, value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves the kernel metrics over HTTP on localhost
+    from a background thread.
+
+    """
+    def __init__(self, metrics: KernelMetrics, port: int = 0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='iclips-metrics', daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:%d/metrics' % self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.partition('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        """Scrapes are not logged."""
+
+
+def execution_metrics(elapsed: float, firings: int, facts: tuple,
+                      memory: tuple, commands: list, limit: int) -> dict:
+    """Return the metrics of an execution as reply metadata.
+
+    Facts and memory are given as (before, after) pairs. Only the
+    `limit` slowest commands are reported, in execution order.
+
+    """
+    slowest = sorted(heapq.nlargest(limit, commands, key=lambda c: c.time))
+
+    return {'time': elapsed,
+            'firings': firings,
+            'facts': {'before': facts[0], 'after': facts[1],
+                      'delta': facts[1] - facts[0]},
+            'memory': {'before': memory[0], 'after': memory[1],
+                       'delta': memory[1] - memory[0]},
+            'commands': [c._asdict() for c in slowest],
+            'commands_omitted': len(commands) - len(slowest)}
+
+
+def command_label(code: str) -> str:
+    """Shorten the command code to be reported."""
+    label = ' '.join(code.split())
+
+    return label if len(label) <= LABEL_SIZE else label[:LABEL_SIZE] + '...'
+
+
+def prometheus_float(value: float) -> str:
+    return '+Inf' if value == INFINITY else repr(value)
+
+
+REQUESTS = ('execute', 'complete', 'is_complete')
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LABEL_SIZE = 80
+INFINITY = float('inf')
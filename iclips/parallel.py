@@ -0,0 +1,184 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Parallel evaluation of partitioned fact sets.
+
+The environment constructs are shipped to the worker processes
+as a binary image. The facts of a template are partitioned by the value
+of one of its slots, each partition is evaluated by a worker together
+with all the other facts. The facts resulting from each evaluation
+are merged back into the environment.
+
+"""
+
+import os
+import time
+import tempfile
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import clips
+
+from iclips.display import table
+from iclips.snapshot import literal
+
+
+class PartitionResult(NamedTuple):
+    """Outcome of the evaluation of a partition within a worker."""
+    partition: int
+    worker: int
+    facts: tuple
+    input_facts: int
+    firings: int
+    time: float  # CPU seconds
+    started: float  # wall clock
+    finished: float
+
+
+class ParallelReport:
+    """Timing of a parallel evaluation.
+
+    The CPU time spent by the workers estimates the sequential evaluation.
+    The speedup is the estimate over the time the workers were evaluating,
+    from the start of the first partition to the end of the last one,
+    which leaves out the startup of the worker processes.
+
+    """
+    def __init__(self, workers: int, results: list, elapsed: float):
+        self.workers = workers
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def busy(self) -> float:
+        return sum(r.time for r in self.results)
+
+    @property
+    def evaluation(self) -> float:
+        if not self.results:
+            return 0.0
+
+        return (max(r.finished for r in self.results) -
+                min(r.started for r in self.results))
+
+    @property
+    def speedup(self) -> float:
+        return self.busy / self.evaluation if self.evaluation > 0 else 0
+
+    def __str__(self):
+        return ("Evaluated %d partitions on %d workers in %.3f seconds, "
+                "%.3f evaluating against %.3f sequentially, "
+                "speedup %.2f (%.0f%% efficiency)\n" % (
+                    len(self.results), self.workers, self.elapsed,
+                    self.evaluation, self.busy,
+                    self.speedup, self.speedup / self.workers * 100))
+
+    def tables(self) -> list:
+        """Render the time spent by each worker as display data."""
+        workers = {}
+        for result in self.results:
+            workers.setdefault(result.worker, []).append(result)
+
+        return [table(('Partition', 'Worker', 'Input facts', 'Output facts',
+                       'Firings', 'CPU time'),
+                      [(r.partition, r.worker, r.input_facts, len(r.facts),
+                        r.firings, r.time) for r in self.results],
+                      title='Partitions'),
+                table(('Worker', 'Partitions', 'Firings', 'CPU time',
+                       'Speedup'),
+                      [(w, len(r), sum(p.firings for p in r),
+                        sum(p.time for p in r),
+                        sum(p.time for p in r) / self.evaluation
+                        if self.evaluation > 0 else 0)
+                       for w, r in sorted(workers.items())],
+                      title='Workers')]
+
+
+def evaluate_partitions(environment: clips.Environment,
+                        executor: ProcessPoolExecutor, template: str,
+                        key: str, partitions: int, workers: int,
+                        ) -> ParallelReport:
+    """Evaluate the template facts partitioned by the key slot.
+
+    The environment facts are replaced by the union of the facts
+    resulting from the evaluation of each partition.
+
+    """
+    start = time.perf_counter()
+    deftemplate = environment.find_template(template)
+    if key not in (s.name for s in deftemplate.slots):
+        raise LookupError("Template %s has no slot %s" % (template, key))
+
+    shared, split = [], [[] for _ in range(partitions)]
+    for fact in environment.facts():
+        if fact.template.name == template:
+            split[hash(repr(fact[key])) % partitions].append(fact_string(fact))
+        else:
+            shared.append(fact_string(fact))
+
+    with tempfile.TemporaryDirectory(prefix='iclips-') as directory:
+        image = os.path.join(directory, 'constructs.bin')
+        environment.save(image, binary=True)
+
+        futures = [executor.submit(evaluate, index, image, shared + facts)
+                   for index, facts in enumerate(split) if facts]
+        results = [f.result() for f in futures]
+
+    environment.eval('(retract *)')
+    for result in results:
+        for fact in result.facts:
+            environment.assert_string(fact)
+    # the activations were already fired within the workers
+    for activation in tuple(environment.activations()):
+        activation.delete()
+
+    return ParallelReport(workers, results, time.perf_counter() - start)
+
+
+def evaluate(partition: int, image: str, facts: list) -> PartitionResult:
+    """Run the agenda over the facts within a worker process."""
+    started = time.time()
+    start = time.process_time()
+    environment = clips.Environment()
+    environment.load(image, binary=True)
+
+    for fact in facts:
+        environment.assert_string(fact)
+    firings = environment.run()
+
+    return PartitionResult(
+        partition, os.getpid(),
+        tuple(fact_string(f) for f in environment.facts()),
+        len(facts), firings, time.process_time() - start,
+        started, time.time())
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """Worker processes are spawned as forking the kernel is unsafe."""
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=get_context('spawn'))
+
+
+def fact_string(fact) -> str:
+    """Return the fact in the syntax of the CLIPS (assert) command."""
+    if fact.template.implied:
+        return '(%s %s)' % (fact.template.name,
+                            ' '.join(literal(v) for v in fact))
+
+    return '(%s %s)' % (fact.template.name, ' '.join(
+        '(%s %s)' % (slot, ' '.join(literal(v) for v in value)
+                     if isinstance(value, tuple) else literal(value))
+        for slot, value in fact))
@@ -0,0 +1,122 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Profiling of CLIPS constructs and Python functions."""
+
+import time
+import functools
+from typing import NamedTuple
+
+from iclips.display import table
+
+
+class ProfiledFunction:
+    """Wraps a Python function recording its calls and execution time
+    while active.
+
+    """
+    def __init__(self, function: callable):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.active = False
+        self.calls = 0
+        self.time = 0.0
+
+    def __call__(self, *arguments):
+        if not self.active:
+            return self.function(*arguments)
+
+        start = time.perf_counter()
+
+        try:
+            return self.function(*arguments)
+        finally:
+            self.calls += 1
+            self.time += time.perf_counter() - start
+
+    def reset(self):
+        self.calls = 0
+        self.time = 0.0
+
+
+class ProfileEntry(NamedTuple):
+    """A construct entry reported by the CLIPS (profile-info) command."""
+    kind: str
+    name: str
+    entries: int
+    time: float
+    time_kids: float
+
+
+def parse_profile_info(text: str) -> list:
+    """Parse the output of the CLIPS (profile-info) command."""
+    kind = None
+    entries = []
+
+    for line in text.splitlines():
+        line = line.strip()
+
+        if line.startswith('***') and line.endswith('***'):
+            kind = line.strip('* ')
+        elif kind is not None and line:
+            fields = line.split()
+            try:
+                entries.append(ProfileEntry(
+                    kind, ' '.join(fields[:-5]), int(fields[-5]),
+                    float(fields[-4]), float(fields[-2])))
+            except (ValueError, IndexError):
+                continue
+
+    return entries
+
+
+def profile_tables(entries: list, functions: dict, commands: list,
+                   sort: str = 'time') -> list:
+    """Render the profiling results as display data.
+
+    Python function statistics are matched with the construct entries
+    by name. Constructs are sorted by the given column.
+
+    """
+    rows = [(e.kind, e.name, e.entries, e.time, e.time_kids) +
+            python_statistics(functions.get(e.name))
+            for e in entries]
+    rows.sort(key=PROFILE_SORT[sort], reverse=sort != 'name')
+
+    return [table(('Construct', 'Name', 'Entries', 'Time', 'Time+Kids',
+                   'Python calls', 'Python time'),
+                  rows, title='Constructs'),
+            table(('Command', 'Time'),
+                  [(command_summary(c), t) for c, t in commands],
+                  title='Commands')]
+
+
+def python_statistics(function: ProfiledFunction) -> tuple:
+    if function is None:
+        return '', ''
+
+    return function.calls, function.time
+
+
+def command_summary(code: str, length: int = 60) -> str:
+    code = ' '.join(code.split())
+
+    return code if len(code) <= length else code[:length - 3] + '...'
+
+
+PROFILE_SORT = {'time': lambda r: r[3],
+                'kids': lambda r: r[4],
+                'entries': lambda r: r[2],
+                'name': lambda r: (r[0], r[1])}
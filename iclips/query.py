@@ -0,0 +1,477 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Secondary indexes of facts by slot value.
+
+The facts of a template are kept sorted by the value of the indexed
+slots, equality and range lookups bisect the sorted entries.
+
+The indexes follow the assertions and retractions through the fact
+watch traces of the indexed templates, captured by a router. The traces
+are displayed only if the user watches the facts of the template
+as well. The slot values of the asserted facts are read on the following
+lookup. If the traces were disabled, changes might have been missed:
+the index is rebuilt on the following lookup instead.
+
+"""
+
+import bisect
+import contextlib
+
+import clips
+
+from iclips.snapshot import literal
+
+
+class SlotIndex:
+    """The facts of a template sorted by the value of one of its slots.
+
+    Values are ordered by type first: numbers, symbols, instance names,
+    strings and any other value.
+
+    """
+    def __init__(self, template: str, slot: str):
+        self.template = template
+        self.slot = slot
+        self._entries = []  # (key, fact index)
+        self._keys = {}  # fact index: key
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, fact: int, value):
+        key = index_key(value)
+        self._keys[fact] = key
+        bisect.insort(self._entries, (key, fact))
+
+    def remove(self, fact: int):
+        key = self._keys.pop(fact, None)
+        if key is not None:
+            del self._entries[bisect.bisect_left(self._entries, (key, fact))]
+
+    def build(self, facts: list):
+        """Replace the entries with the given (fact index, value) pairs."""
+        self._keys = {f: index_key(v) for f, v in facts}
+        self._entries = sorted((k, f) for f, k in self._keys.items())
+
+    def lookup(self, value) -> list:
+        """Return the indexes of the facts with the given slot value."""
+        key = index_key(value)
+
+        return self._slice((key,), (key, INFINITY))
+
+    def range(self, low=None, high=None) -> list:
+        """Return the indexes of the facts with slot values
+        within the inclusive bounds.
+
+        An unbounded range is limited to values of the same type
+        as the other bound.
+
+        """
+        if low is None and high is None:
+            return [f for _, f in self._entries]
+
+        if low is not None and high is not None:
+            if index_key(low)[0] != index_key(high)[0]:
+                raise ValueError("Range bounds of different types")
+
+        rank = index_key(low if low is not None else high)[0]
+        start = (index_key(low),) if low is not None else ((rank,),)
+        stop = (index_key(high), INFINITY) if high is not None \
+            else ((rank + 1,),)
+
+        return self._slice(start, stop)
+
+    def _slice(self, start: tuple, stop: tuple) -> list:
+        entries = self._entries
+
+        return [f for _, f in entries[bisect.bisect_left(entries, start):
+                                      bisect.bisect_right(entries, stop)]]
+
+
+class IndexedTemplate:
+    """The indexes of a template and its facts not yet indexed.
+
+    The template is watched while indexed, `watch` is whether
+    the user watches it as well.
+
+    """
+    def __init__(self, template: clips.Template):
+        self.name = template.name
+        self.template = template
+        self.watch = template.watch
+        self.slots = {}  # slot name: SlotIndex
+        self.pending = set()
+        self.stale = True
+
+
+class FactIndexes:
+    """Secondary indexes of the facts within the environment.
+
+    Lookups return fact indexes, as accepted by the CLIPS fact functions.
+
+    """
+    def __init__(self, environment: clips.Environment):
+        self.environment = environment
+        self.templates = {}  # template name: IndexedTemplate
+        self._router = None
+
+    @property
+    def indexes(self) -> list:
+        return [i for t in self.templates.values() for i in t.slots.values()]
+
+    def create(self, template: str, slot: str) -> SlotIndex:
+        """Index the facts of the template by the given slot.
+
+        Only single-field slots can be indexed.
+
+        """
+        deftemplate = self.environment.find_template(template)
+        if deftemplate.implied:
+            raise ValueError("Implied template %s has no slots" % template)
+        slots = {s.name: s for s in deftemplate.slots}
+        if slot not in slots:
+            raise LookupError("Template %s has no slot %s" % (template, slot))
+        if slots[slot].multifield:
+            raise ValueError("Multislot %s cannot be indexed" % slot)
+
+        indexed = self.templates.get(template)
+        if indexed is None:
+            indexed = self.templates[template] = IndexedTemplate(deftemplate)
+        if slot not in indexed.slots:
+            indexed.slots[slot] = SlotIndex(template, slot)
+            indexed.stale = True
+
+        if self._router is None:
+            self._router = TraceRouter(self)
+            self.environment.add_router(self._router)
+
+        return self.index(template, slot)
+
+    def drop(self, template: str, slot: str):
+        indexed = self.templates.get(template)
+        if indexed is None or slot not in indexed.slots:
+            raise LookupError("No index on %s %s" % (template, slot))
+
+        del indexed.slots[slot]
+        if not indexed.slots:
+            self.release(indexed)
+
+    def close(self):
+        """Drop all the indexes."""
+        for indexed in tuple(self.templates.values()):
+            self.release(indexed)
+
+    def invalidate(self):
+        """Rebuild the indexes on the following lookup."""
+        for indexed in self.templates.values():
+            indexed.stale = True
+
+    def sync(self):
+        """Catch up with the watch flags changed outside the kernel
+        watch commands.
+
+        A template no longer watched might have missed changes: it is
+        rebuilt on the following lookup and watched again.
+
+        """
+        for indexed in self.templates.values():
+            try:
+                if not indexed.template.watch:
+                    indexed.watch = False
+                    indexed.stale = True
+                    indexed.template.watch = True
+            except clips.CLIPSError:  # left to the following lookup
+                pass
+
+    @contextlib.contextmanager
+    def user_watch(self):
+        """Hand the watch flags of the indexed templates over to the user
+        within the context, as for (watch) and (unwatch) commands.
+
+        """
+        self._set_watch(lambda indexed: indexed.watch)
+
+        try:
+            yield
+        finally:
+            for indexed in self.templates.values():
+                try:
+                    indexed.watch = indexed.template.watch
+                except clips.CLIPSError:
+                    pass
+            self._set_watch(lambda _: True)
+
+    def lookup(self, template: str, slot: str, value) -> list:
+        """Return the indexes of the facts with the given slot value."""
+        return self.index(template, slot).lookup(value)
+
+    def range(self, template: str, slot: str, low=None, high=None) -> list:
+        """Return the indexes of the facts with slot values
+        within the inclusive bounds.
+
+        """
+        return self.index(template, slot).range(low, high)
+
+    def index(self, template: str, slot: str) -> SlotIndex:
+        """Return the index on the template slot brought up to date."""
+        indexed = self.templates.get(template)
+        if indexed is None or slot not in indexed.slots:
+            raise LookupError("No index on %s %s" % (template, slot))
+
+        try:
+            watch = indexed.template.watch
+        except clips.CLIPSError:
+            self.release(indexed)
+            raise LookupError("Template %s is no longer defined" % template)
+
+        if indexed.stale or not watch:
+            self.rebuild(indexed)
+        elif indexed.pending:
+            self.resolve(indexed)
+
+        return indexed.slots[slot]
+
+    def rebuild(self, indexed: IndexedTemplate):
+        """Index all the facts of the template."""
+        indexed.template.watch = True
+        indexed.pending.clear()
+        facts = [(f.index, f) for f in indexed.template.facts()]
+
+        for slot, index in indexed.slots.items():
+            index.build([(i, f[slot]) for i, f in facts])
+        indexed.stale = False
+
+    def resolve(self, indexed: IndexedTemplate):
+        """Index the facts asserted since the last lookup.
+
+        CLIPS reads the evaluated strings querying every router for each
+        character: reading the slot values of a fact costs as much as
+        scanning several facts. Many pending facts are indexed rebuilding
+        the whole index.
+
+        """
+        slots = tuple(indexed.slots)
+        if len(indexed.pending) * SCAN_RATIO >= len(indexed.slots[slots[0]]):
+            self.rebuild(indexed)
+            return
+
+        facts = sorted(indexed.pending)
+        for start in range(0, len(facts), BATCH_SIZE):
+            batch = facts[start:start + BATCH_SIZE]
+            values = iter(self.environment.eval('(create$ %s)' % ' '.join(
+                '(fact-slot-value %d %s)' % (f, s)
+                for f in batch for s in slots)))
+            for fact in batch:
+                for slot in slots:
+                    indexed.slots[slot].add(fact, next(values))
+        indexed.pending.clear()
+
+    def release(self, indexed: IndexedTemplate):
+        del self.templates[indexed.name]
+
+        try:
+            indexed.template.watch = indexed.watch
+        except clips.CLIPSError:
+            pass
+
+        if not self.templates and self._router is not None:
+            self._router.delete()
+            self._router = None
+
+    def trace(self, event: str, template: str, fact: int):
+        """Follow the assertion or retraction of a fact.
+
+        A modified fact is retracted and asserted again
+        with the same fact index.
+
+        """
+        indexed = self.templates[template]
+
+        if event == ASSERT:
+            indexed.pending.add(fact)
+        elif fact in indexed.pending:
+            indexed.pending.discard(fact)
+        else:
+            for index in indexed.slots.values():
+                index.remove(fact)
+
+    def _set_watch(self, watch: callable):
+        for indexed in self.templates.values():
+            try:
+                indexed.template.watch = watch(indexed)
+            except clips.CLIPSError:
+                pass
+
+
+class TraceRouter(clips.Router):
+    """Captures the fact watch traces of the indexed templates.
+
+    A trace is written in pieces: the event, the fact index,
+    the opening parenthesis, the template name and the slots.
+    Strings are written in three pieces: the quotes and the content,
+    which might contain quotes or newlines itself. The trace ends
+    with a newline outside of strings.
+
+    The traces the user watches and any other output are shared
+    with the other routers.
+
+    """
+    def __init__(self, indexes: FactIndexes):
+        super().__init__('iclips-index-router-%x' % id(indexes), 45)
+        self._indexes = indexes
+        self._trace = []
+        self._consuming = None  # None, or whether the trace is shared
+        self._string = OUTSIDE
+
+    def query(self, name: str) -> bool:
+        return name == 'stdout'
+
+    def write(self, name: str, message: str):
+        if self._consuming is not None:
+            self.consume(name, message)
+            return
+
+        trace = self._trace
+        if not trace:
+            if message in (ASSERT, RETRACT):
+                trace.append(message)
+            else:
+                self.share_message(name, message)
+            return
+
+        trace.append(message)
+        if ((len(trace) == 2 and message.startswith('f-')) or
+                (len(trace) == 3 and message == '(')):
+            return
+
+        self._trace = []
+        indexed = self._indexes.templates.get(message) \
+            if len(trace) == 4 else None
+        if indexed is None:
+            self.share_message(name, ''.join(trace))
+            return
+
+        self._consuming = indexed.watch
+        self._indexes.trace(trace[0], message, int(trace[1][2:]))
+        if indexed.watch:
+            self.share_message(name, ''.join(trace))
+
+    def consume(self, name: str, message: str):
+        """Follow the trace until its end, sharing it if watched."""
+        if self._consuming:
+            self.share_message(name, message)
+
+        state = self._string
+        if state == OUTSIDE:
+            if message == '"':
+                self._string = OPENED
+            elif message == '\n':
+                self._consuming = None
+        elif state == OPENED:  # content, or closing an empty string
+            self._string = QUOTE if message == '"' else CONTENT
+        elif state == CONTENT:
+            self._string = OUTSIDE
+        elif message == '"':  # QUOTE: the content was a quote
+            self._string = OUTSIDE
+        else:  # QUOTE: the string was empty
+            self._string = OUTSIDE
+            if message == '\n':
+                self._consuming = None
+
+
+def index_key(value) -> tuple:
+    if isinstance(value, (int, float)):
+        return 0, value
+    if isinstance(value, clips.InstanceName):
+        return 2, value
+    if isinstance(value, clips.Symbol):
+        return 1, value
+    if isinstance(value, str):
+        return 3, value
+
+    return 4, str(value)
+
+
+def fact_values(environment: clips.Environment, template: str,
+                facts: list) -> list:
+    """Return the slot values of the given facts of the template.
+
+    The values are read in batches.
+
+    """
+    slots = environment.find_template(template).slots
+    rows = []
+
+    for start in range(0, len(facts), BATCH_SIZE):
+        batch = facts[start:start + BATCH_SIZE]
+        values = iter(environment.eval('(create$ %s)' % ' '.join(
+            ('(length$ (fact-slot-value %d %s)) (fact-slot-value %d %s)'
+             if s.multifield else '(fact-slot-value %d %s)')
+            % ((f, s.name) * (2 if s.multifield else 1))
+            for f in batch for s in slots)))
+
+        for _ in batch:
+            rows.append(tuple(
+                tuple(next(values) for _ in range(next(values)))
+                if s.multifield else next(values) for s in slots))
+
+    return rows
+
+
+def display_value(value) -> str:
+    """Render the slot value as written within a fact."""
+    if isinstance(value, tuple):
+        return ' '.join(display_value(v) for v in value)
+
+    try:
+        return literal(value)
+    except TypeError:  # fact addresses and external addresses
+        return str(value)
+
+
+def facts_label(count: int) -> str:
+    return '%d fact%s' % (count, '' if count == 1 else 's')
+
+
+def query_value(types: tuple, text: str):
+    """Convert the text given as query value into a slot value.
+
+    Double quoted text is a string, unquoted text is a number if it can
+    be read as such, a symbol otherwise unless the slot types allow
+    only strings.
+
+    """
+    if len(text) > 1 and text.startswith('"') and text.endswith('"'):
+        return text[1:-1]
+
+    for number in (int, float):
+        try:
+            return number(text)
+        except ValueError:
+            pass
+
+    if 'STRING' in types and 'SYMBOL' not in types:
+        return text
+
+    return clips.Symbol(text)
+
+
+ASSERT = '==> '
+RETRACT = '<== '
+OUTSIDE, OPENED, CONTENT, QUOTE = range(4)  # trace string states
+SCAN_RATIO = 10
+BATCH_SIZE = 1000
+INFINITY = float('inf')
@@ -0,0 +1,81 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Rete network statistics."""
+
+import re
+from typing import NamedTuple
+
+from iclips.display import table
+
+
+class RuleMatches(NamedTuple):
+    """Alpha memory size of each pattern and beta memory size of each join
+    of a rule as reported by the CLIPS (matches) command.
+
+    """
+    rule: str
+    alpha: tuple
+    beta: tuple
+    activations: int
+
+    @property
+    def cost(self) -> tuple:
+        return sum(self.beta), sum(self.alpha)
+
+
+def parse_matches(rule: str, text: str) -> RuleMatches:
+    """Parse the succinct output of the CLIPS (matches) command."""
+    alpha = []
+    beta = []
+    activations = 0
+
+    for kind, count in MATCHES_REGEX.findall(text):
+        if kind == 'Pattern':
+            alpha.append(int(count))
+        elif kind == 'CEs':
+            beta.append(int(count))
+        else:
+            activations = int(count)
+
+    return RuleMatches(rule, tuple(alpha), tuple(beta), activations)
+
+
+def rete_table(matches: dict, previous: dict, top: int = None) -> dict:
+    """Render the rules matches ranked by their partial matches.
+
+    The growth of the memories is computed against
+    the previous matches, if any.
+
+    """
+    rows = []
+
+    for rule in sorted(matches.values(), key=lambda m: m.cost, reverse=True):
+        before = previous.get(rule.rule)
+        beta, alpha = rule.cost
+        growth = (beta - before.cost[0], alpha - before.cost[1]) \
+            if before is not None else ('', '')
+
+        rows.append((rule.rule, beta, alpha, rule.activations) + growth +
+                    (' '.join(str(c) for c in rule.alpha),
+                     ' '.join(str(c) for c in rule.beta)))
+
+    return table(('Rule', 'Partial matches', 'Alpha matches', 'Activations',
+                  'Partial growth', 'Alpha growth', 'Patterns', 'Joins'),
+                 rows[:top], title='Rete network')
+
+
+MATCHES_REGEX = re.compile(
+    r'^(Pattern|CEs|Activations)[^:]*:\s*(\d+)', re.MULTILINE)
@@ -0,0 +1,184 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""CLIPS I/O Routers connecting the environment to the kernel."""
+
+import time
+import threading
+import contextvars
+from collections import deque
+
+import clips
+
+
+class InputRouter(clips.Router):
+    """CLIPS Router for capturing input requests.
+
+    The queued input is read first, once consumed the input
+    is requested to the client one line at a time.
+
+    """
+    def __init__(self, kernel):
+        # queried before the output routers on each character read
+        super().__init__('iclips-input-router', 50)
+        self._kernel = kernel
+        self._buffer = ''
+        self._position = 0
+        self._queue = deque()
+
+    @property
+    def queued(self) -> int:
+        """Characters of queued input not yet read."""
+        return (len(self._buffer) - self._position +
+                sum(len(t) for t in self._queue))
+
+    def feed(self, text: str):
+        """Queue the text as input."""
+        self._queue.append(text)
+
+    def clear(self):
+        """Discard the queued input."""
+        self._queue.clear()
+        self._buffer = ''
+        self._position = 0
+
+    def query(self, name: str) -> bool:
+        return name == 'stdin'
+
+    def read(self, _name: str) -> int:
+        """Returns the next character in the input.
+        If the input buffer is empty, it is refilled from the queue
+        or requested from the client.
+
+        """
+        if self._position >= len(self._buffer) and not self.fill():
+            return EOF
+
+        char = self._buffer[self._position]
+        self._position += 1
+
+        return ord(char)
+
+    def unread(self, _name: str, _char: int) -> int:
+        if self._position > 0:
+            self._position -= 1
+            return 1
+
+        return 0
+
+    def fill(self) -> bool:
+        """Refill the buffer, False if no more input is available."""
+        while self._queue:
+            self._buffer = self._queue.popleft()
+            self._position = 0
+            if self._buffer:
+                return True
+
+        line = self._kernel.input_line()
+        if line is None:
+            return False
+
+        # raw_input truncates the newline
+        self._buffer = line + '\n'
+        self._position = 0
+
+        return True
+
+
+class OutputRouter(clips.Router):
+    """CLIPS Router for capturing output requests.
+
+    If a callback is set, the buffered output is flushed to it
+    once its size exceeds `size` characters or once it is older
+    than `interval` seconds. A timer flushes the output
+    written before CLIPS falls silent.
+
+    If a trace aggregator is set, the standard and warning output
+    goes through it.
+
+    """
+    ROUTERS = {'stdout', 'stderr', 'stdwrn'}
+
+    def __init__(self, size: int = 65536, interval: float = 0.1):
+        super().__init__('iclips-output-router', 40)
+        self.size = size
+        self.interval = interval
+        self.callback = None
+        self.aggregator = None
+        self._chunks = []
+        self._length = 0
+        self._flushed = time.monotonic()
+        self._lock = threading.RLock()  # the timer flushes from its thread
+        self._timer = None
+
+    @property
+    def output(self) -> str:
+        with self._lock:
+            ret = ''.join(self._chunks)
+            self.reset()
+
+        return ret
+
+    def query(self, name: str) -> bool:
+        return name in self.ROUTERS
+
+    def write(self, name: str, message: str):
+        """Appends the CLIPS message to the output."""
+        if self.aggregator is not None and name != 'stderr':
+            message = self.aggregator.write(message)
+            if not message:
+                return
+
+        self.append(message)
+
+    def append(self, message: str):
+        """Appends the message to the output flushing it if needed."""
+        with self._lock:
+            self._chunks.append(message)
+            self._length += len(message)
+
+            if self.callback is None:
+                return
+            if (self._length >= self.size or
+                    time.monotonic() - self._flushed >= self.interval):
+                self.flush()
+            elif self._timer is None and self.interval > 0:
+                # the callback needs the context of the current request
+                self._timer = threading.Timer(
+                    self.interval, contextvars.copy_context().run,
+                    (self._expire,))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Hand the buffered output over to the callback."""
+        with self._lock:
+            self._flushed = time.monotonic()
+
+            if self._chunks and self.callback is not None:
+                self.callback(self.output)
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+            self.flush()
+
+    def reset(self):
+        """Discard the buffered output."""
+        self._chunks = []
+        self._length = 0
+
+
+EOF = -1
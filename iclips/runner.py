@@ -0,0 +1,176 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Headless execution of CLIPS files and notebooks.
+
+The code is executed by the kernel within the current process,
+without frontend. The output is written to the standard output
+as it is produced.
+
+A CLIPS file is executed as a single cell, a notebook cell by cell.
+The execution stops at the first cell reporting an error.
+
+"""
+
+import sys
+import json
+import time
+from io import StringIO
+from typing import NamedTuple
+from concurrent.futures import as_completed
+
+from iclips.clips_kernel import CLIPSKernel
+from iclips.display import text_table
+
+
+class RunResult(NamedTuple):
+    path: str
+    status: str
+    cells: int
+    time: float
+    output: str
+
+
+class BatchKernel(CLIPSKernel):
+    """Kernel writing its output into a file instead of the frontend.
+
+    Displays are written as plain text, their updates are discarded.
+
+    """
+    def __init__(self, output, **kwargs):
+        super().__init__(**kwargs)
+        self.output = output
+
+    def send_response(self, _stream, msg_or_type, content=None,
+                      *_args, **_kwargs):
+        if msg_or_type == 'stream':
+            self.output.write(content['text'])
+        elif msg_or_type == 'display_data':
+            text = content['data'].get('text/plain', '')
+            self.output.write(text if text.endswith('\n') else text + '\n')
+        self.output.flush()
+
+    def run_cells(self, cells: list) -> tuple:
+        """Execute the cells returning the status and the amount executed."""
+        executed = 0
+
+        for code in cells:
+            self.execution_count += 1
+            executed += 1
+
+            reply = self.do_execute(code, False)
+            if reply['status'] != 'ok':
+                return reply['status'], executed
+
+        return 'ok', executed
+
+
+def run_file(path: str, stdin: str = None, capture: bool = False):
+    """Execute the CLIPS file or notebook.
+
+    If given, the `stdin` file content is queued as input. If `capture`
+    is True, the output is returned instead of being written
+    to the standard output.
+
+    """
+    output = StringIO() if capture else sys.stdout
+    start = time.perf_counter()
+
+    try:
+        cells = file_cells(path)
+        kernel = BatchKernel(output)
+        if stdin is not None:
+            with open(stdin) as input_file:
+                kernel.clips_input.feed(input_file.read())
+    except (OSError, ValueError) as error:
+        output.write("Unable to run %s: %s\n" % (path, error))
+        return RunResult(path, 'error', 0, time.perf_counter() - start,
+                         output.getvalue() if capture else '')
+
+    status, executed = kernel.run_cells(cells)
+
+    return RunResult(path, status, executed, time.perf_counter() - start,
+                     output.getvalue() if capture else '')
+
+
+def run_files(paths: list, workers: int = 1, stdin: str = None) -> list:
+    """Execute the files, on a pool of worker processes if more than one.
+
+    The output of each file is written once its execution is over.
+
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return [run_file(path, stdin) for path in paths]
+
+    from iclips.parallel import worker_pool
+
+    results = []
+    with worker_pool(workers) as executor:
+        futures = [executor.submit(run_file, path, stdin, True)
+                   for path in paths]
+
+        for future in as_completed(futures):
+            result = future.result()
+            sys.stdout.write("==> %s <==\n%s" % (result.path, result.output))
+            sys.stdout.flush()
+            results.append(result)
+
+    order = {p: i for i, p in enumerate(paths)}
+
+    return sorted(results, key=lambda r: order[r.path])
+
+
+def file_cells(path: str) -> list:
+    """Return the code cells of the notebook, the whole file content
+    as a single cell otherwise.
+
+    """
+    with open(path) as source:
+        if not path.endswith('.ipynb'):
+            return [source.read()]
+
+        try:
+            notebook = json.load(source)
+        except json.JSONDecodeError as error:
+            raise ValueError("Invalid notebook: %s" % error)
+
+    return [''.join(c['source']) if isinstance(c['source'], list)
+            else c['source'] for c in notebook.get('cells', ())
+            if c.get('cell_type') == 'code']
+
+
+def summary(results: list, elapsed: float) -> str:
+    """Render the timing summary of the executed files."""
+    failed = sum(1 for r in results if r.status != 'ok')
+    rows = [(r.path, r.status, str(r.cells), '%.3f' % r.time)
+            for r in results]
+
+    return text_table(('File', 'Status', 'Cells', 'Seconds'), rows) + (
+        "%d files, %d failed, %.3f seconds\n" % (
+            len(results), failed, elapsed))
+
+
+def main(arguments) -> int:
+    """Run the files given via command line arguments
+    returning the exit status.
+
+    """
+    start = time.perf_counter()
+    results = run_files(arguments.files, arguments.jobs, arguments.stdin)
+
+    if not arguments.quiet:
+        sys.stderr.write(summary(results, time.perf_counter() - start))
+
+    return 0 if all(r.status == 'ok' for r in results) else 1
@@ -0,0 +1,98 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Binary snapshots of CLIPS environments.
+
+A snapshot is a directory containing the binary image of the constructs
+(bsave), the binary dumps of facts and instances and the current values
+of the defglobals.
+
+"""
+
+import os
+
+import clips
+
+
+def save_snapshot(environment: clips.Environment, path: str):
+    """Save the environment constructs, facts, instances and globals."""
+    os.makedirs(path, exist_ok=True)
+
+    environment.save(os.path.join(path, CONSTRUCTS), binary=True)
+    environment.eval('(bsave-facts %s)' % string(os.path.join(path, FACTS)))
+    environment.eval('(bsave-instances %s)'
+                     % string(os.path.join(path, INSTANCES)))
+
+    with open(os.path.join(path, GLOBALS), 'w') as globals_file:
+        for defglobal in environment.globals():
+            try:
+                value = literal(defglobal.value)
+            except TypeError:
+                continue
+
+            globals_file.write('%s::%s %s\n' % (
+                defglobal.module.name, defglobal.name, value))
+
+
+def load_snapshot(environment: clips.Environment, path: str):
+    """Restore the environment from the snapshot.
+
+    The environment is cleared and the defglobals are set to their
+    values at the time of saving. As after a CLIPS (bload), no construct
+    can be defined until the environment is cleared again.
+
+    """
+    if not os.path.isfile(os.path.join(path, CONSTRUCTS)):
+        raise FileNotFoundError("No snapshot found in %s" % path)
+
+    environment.load(os.path.join(path, CONSTRUCTS), binary=True)
+    environment.eval('(bload-facts %s)' % string(os.path.join(path, FACTS)))
+    environment.eval('(bload-instances %s)'
+                     % string(os.path.join(path, INSTANCES)))
+
+    with open(os.path.join(path, GLOBALS)) as globals_file:
+        values = dict(line.rstrip('\n').split(' ', 1) for line in globals_file)
+
+    for defglobal in environment.globals():
+        name = '%s::%s' % (defglobal.module.name, defglobal.name)
+        if name in values:
+            defglobal.value = environment.eval(values[name])
+
+
+def literal(value) -> str:
+    """Return the CLIPS literal representing the value."""
+    if isinstance(value, clips.Symbol):
+        return str(value) if not isinstance(value, clips.InstanceName) \
+            else '[%s]' % value
+    if isinstance(value, str):
+        return string(value)
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return '(create$ %s)' % ' '.join(literal(v) for v in value)
+
+    raise TypeError("Cannot represent %r as CLIPS literal" % value)
+
+
+def string(value: str) -> str:
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+CONSTRUCTS = 'constructs.bin'
+FACTS = 'facts.bin'
+INSTANCES = 'instances.bin'
+GLOBALS = 'globals.clp'
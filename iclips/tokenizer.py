@@ -0,0 +1,197 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Linear time splitting of CLIPS code into top level forms."""
+
+import re
+from typing import NamedTuple
+
+
+class Form(NamedTuple):
+    """A top level CLIPS form and its offsets within the source code."""
+    start: int
+    end: int
+    code: str
+    complete: bool = True
+
+    @property
+    def head(self) -> str:
+        return head(self.code)
+
+
+class Scanner:
+    """CLIPS source code scanner.
+
+    Keeps track of parentheses, strings and comments
+    recording the offsets of the top level forms found in the code.
+
+    """
+    def __init__(self):
+        self.length = 0
+        self.depth = 0
+        self.atom = False
+        self.string = False
+        self.escape = False
+        self.comment = False
+        self.unbalanced = False
+        self.forms = []
+        self._start = None
+
+    @property
+    def complete(self) -> bool:
+        """True if no form is left open."""
+        return self.depth == 0 and not self.string
+
+    @property
+    def pending(self) -> int:
+        """The offset of the form left open, None if complete."""
+        return self._start if self.depth > 0 or self.string else None
+
+    def feed(self, text: str):
+        """Scan the given text continuing from the previous state."""
+        pos = 0
+        end = len(text)
+        offset = self.length
+
+        while pos < end:
+            if self.comment:
+                newline = text.find('\n', pos)
+                if newline < 0:
+                    break
+                self.comment = False
+                pos = newline + 1
+            elif self.string:
+                if self.escape:
+                    self.escape = False
+                    pos += 1
+                    continue
+
+                match = STRING_REGEX.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == '\\':
+                    self.escape = True
+                else:
+                    self.string = False
+                    if self.depth == 0:
+                        self._close(offset + pos)
+            elif self.atom:
+                pos = ATOM_REGEX.match(text, pos).end()
+                if pos < end:
+                    self.atom = False
+                    self._close(offset + pos)
+            elif self.depth > 0:
+                match = FORM_REGEX.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                character = match.group()
+                if character == '(':
+                    self.depth += 1
+                elif character == ')':
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self._close(offset + pos)
+                elif character == '"':
+                    self.string = True
+                else:
+                    self.comment = True
+            else:
+                match = TOP_REGEX.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                character = match.group()
+                if character == '(':
+                    self.depth = 1
+                    self._start = offset + match.start()
+                elif character == ')':
+                    self.unbalanced = True
+                elif character == '"':
+                    self.string = True
+                    self._start = offset + match.start()
+                elif character == ';':
+                    self.comment = True
+                else:
+                    self.atom = True
+                    self._start = offset + match.start()
+
+        self.length += end
+
+    def finish(self):
+        """Close the top level atom left at the end of the code, if any."""
+        if self.atom:
+            self.atom = False
+            self._close(self.length)
+
+    def _close(self, end: int):
+        self.forms.append((self._start, end))
+        self._start = None
+
+
+class IncrementalScanner:
+    """Scanner reusing the state reached on the previously scanned code.
+
+    If the code extends the previous one, only the new text is scanned.
+
+    """
+    def __init__(self):
+        self._code = ''
+        self._scanner = Scanner()
+
+    def scan(self, code: str) -> Scanner:
+        """Scan the given code returning the resulting Scanner state."""
+        if not code.startswith(self._code):
+            self._code = ''
+            self._scanner = Scanner()
+
+        self._scanner.feed(code[len(self._code):])
+        self._code = code
+
+        return self._scanner
+
+
+def split_forms(code: str) -> list:
+    """Split the CLIPS code in its top level forms.
+
+    A trailing form left open is returned as incomplete.
+
+    """
+    scanner = Scanner()
+    scanner.feed(code)
+    scanner.finish()
+
+    forms = [Form(start, end, code[start:end])
+             for start, end in scanner.forms]
+    if scanner.pending is not None:
+        start = scanner.pending
+        forms.append(Form(start, len(code), code[start:], False))
+
+    return forms
+
+
+def head(code: str) -> str:
+    """Return the first symbol within the given form."""
+    match = HEAD_REGEX.match(code)
+
+    return match.group(1) if match is not None else ''
+
+
+TOP_REGEX = re.compile(r'\S')
+FORM_REGEX = re.compile(r'[()";]')
+ATOM_REGEX = re.compile(r'[^\s()";]*')
+STRING_REGEX = re.compile(r'[\\"]')
+HEAD_REGEX = re.compile(r'\(\s*([^\s()";]+)')
@@ -0,0 +1,176 @@
+# This file is part of iCLIPS.
+
+# ICLIPS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ICLIPS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with ICLIPS. If not, see <http://www.gnu.org/licenses/>.
+
+"""Aggregation of the CLIPS watch traces.
+
+CLIPS writes the traces in pieces. The pieces are gathered into lines
+only while they might be part of a trace, any other output is passed
+through as soon as it cannot be one.
+
+Trace lines are counted by event and by the rule, template, class
+or function they concern instead of being displayed.
+
+"""
+
+import re
+from collections import Counter, deque
+
+from iclips.display import table
+
+
+class TraceAggregator:
+    """Counts the watch trace lines written through it.
+
+    The last `tail` trace lines are kept. If `sample` is given,
+    one trace line every `sample` is passed through.
+
+    """
+    def __init__(self, tail: int = 20, sample: int = 0):
+        self.sample = sample
+        self.lines = 0
+        self.counts = Counter()  # (event, name): lines
+        self.tail = deque(maxlen=tail)
+        self._pieces = []
+        self._state = LINE_START
+        self._string = False
+
+    def write(self, message: str) -> str:
+        """Process a piece of output returning the text to pass through."""
+        state = self._state
+
+        if state == TRACE and '\n' not in message:
+            if message == '"':
+                self._string = not self._string
+            self._pieces.append(message)
+            return ''
+        if state == TEXT and '\n' not in message:
+            return message
+
+        output = []
+
+        while message:
+            if self._state == TRACE and self._string:
+                if message == '"':
+                    self._string = False
+                self._pieces.append(message)
+                break
+
+            piece, newline, message = message.partition('\n')
+
+            if self._state == TEXT:
+                output.append(piece + newline)
+            else:
+                self._pieces.append(piece)
+                if self._state == LINE_START:
+                    self._state = line_state(''.join(self._pieces))
+                    if self._state == TEXT:
+                        output.append(''.join(self._pieces) + newline)
+                        self._pieces = []
+
+            if newline:
+                if self._pieces:
+                    output.append(self.trace_line(''.join(self._pieces)))
+                self._pieces = []
+                self._state = LINE_START
+
+        return ''.join(output)
+
+    def close(self) -> str:
+        """Return the text of the incomplete line, if any."""
+        text = ''.join(self._pieces)
+        self._pieces = []
+        self._state = LINE_START
+        self._string = False
+
+        return self.trace_line(text, newline='') if text else ''
+
+    def trace_line(self, line: str, newline: str = '\n') -> str:
+        """Count the trace line returning it if sampled."""
+        match = TRACE_REGEX.match(line)
+        if match is None:
+            return line + newline
+
+        if match.lastgroup != 'continuation':
+            self.lines += 1
+            self.counts[TRACE_EVENTS[match.lastgroup],
+                        match.group(match.lastgroup)] += 1
+        self.tail.append(line)
+
+        if self.sample and (self.lines - 1) % self.sample == 0:
+            return line + newline
+
+        return ''
+
+    def summary(self) -> dict:
+        """Render the counts as display data."""
+        rows = [(e, n, c) for (e, n), c in sorted(
+            self.counts.items(), key=lambda i: (-i[1], i[0]))]
+
+        return table(('Event', 'Name', 'Lines'), rows,
+                     title='%d trace lines%s' % (self.lines, (
+                         ', 1 every %d shown' % self.sample
+                         if self.sample else '')))
+
+    def tail_text(self) -> str:
+        if not self.tail:
+            return ''
+
+        return 'Last %d trace lines:\n%s\n' % (
+            len(self.tail), '\n'.join(self.tail))
+
+
+def line_state(start: str) -> int:
+    """Tell whether the line starting with the given text is a trace."""
+    if start.startswith(TRACE_PREFIXES):
+        return TRACE
+    if any(p.startswith(start) for p in TRACE_PREFIXES):
+        return LINE_START
+
+    return TEXT
+
+
+LINE_START = 0
+TRACE = 1
+TEXT = 2
+TRACE_PREFIXES = ('==> ', '<== ', 'FIRE ', ':== ', '::= ', 'DFN ', 'GNC ',
+                  'MTH ', 'MSG ', 'HND ', '       ED:')
+TRACE_EVENTS = {'assert': 'assert',
+                'retract': 'retract',
+                'activate': 'activate',
+                'deactivate': 'deactivate',
+                'fire': 'fire',
+                'focus': 'focus',
+                'unfocus': 'unfocus',
+                'make_instance': 'make-instance',
+                'unmake_instance': 'unmake-instance',
+                'global': 'global',
+                'slot': 'slot',
+                'call': 'call',
+                'exit': 'exit'}
+TRACE_REGEX = re.compile('|'.join((
+    r'==> f-\d+\s+\((?P<assert>[^\s()]+)',
+    r'<== f-\d+\s+\((?P<retract>[^\s()]+)',
+    r'==> Activation\s+-?\d+\s+(?P<activate>\S+): ',
+    r'<== Activation\s+-?\d+\s+(?P<deactivate>\S+): ',
+    r'FIRE\s+\d+\s+(?P<fire>\S+): ',
+    r'==> Focus (?P<focus>\S+)',
+    r'<== Focus (?P<unfocus>\S+)',
+    r'==> instance \S+ of (?P<make_instance>\S+)',
+    r'<== instance \S+ of (?P<unmake_instance>\S+)',
+    r':== \?\*(?P<global>\S+)\*',
+    r'::= \S+ slot (?P<slot>\S+)',
+    r'(?:DFN|GNC|MTH|MSG|HND) >> (?P<call>\S+)',
+    r'(?:DFN|GNC|MTH|MSG|HND) << (?P<exit>\S+)',
+    r'(?P<continuation>) {7}ED:')))
@@ -24,7 +24,6 @@ setup(
     license='GPL',
     keywords='clips expert-system jupyter',
     install_requires=[
-        'regex',
         'clipspy >= 1.0.0',
         'jupyter-console'
     ],
@@ -33,7 +32,7 @@ setup(
         (os.path.join('share/jupyter/kernels/clips'), ['kernel.js']),
         (os.path.join('share/jupyter/kernels/clips'), ['kernel.css'])
     ],
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     entry_points={
         'console_scripts': [
             'iclips=iclips.__main__:main'